@@ -1,18 +1,69 @@
 from __future__ import annotations
 
-import sqlite3
+from collections import namedtuple
 from typing import List, Optional
 
-from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5 import QtCore, QtWidgets
 
 from . import db
 from .ai_dialog_add_form import AIDialogAddForm
+from .db_worker import LogsQueryJob
+from .table_models import RowsTableModel
+
+
+def _short_text(value: Optional[str], limit: int = 80) -> str:
+    if not value:
+        return ""
+    value = value.strip()
+    head = value[:limit]
+    return head if len(head) == len(value) else head[:-1] + "…"
+
+
+LogRow = namedtuple("LogRow", "id user_id question answer created_at q_short a_short")
+
+
+def _to_log_row(row: db.Record) -> LogRow:
+    question = row["question"] or ""
+    answer = row["answer"] or ""
+    return LogRow(
+        row["id"],
+        str(row["user_id"]) if row["user_id"] is not None else "",
+        question,
+        answer,
+        row["created_at"] or "",
+        _short_text(question),
+        _short_text(answer),
+    )
+
+
+class AILogsModel(RowsTableModel):
+    def __init__(self, parent: Optional[QtCore.QObject] = None) -> None:
+        super().__init__(
+            ["ID", "User ID", "Вопрос", "Ответ", "Создано"],
+            [
+                lambda row: str(row.id),
+                lambda row: row.user_id,
+                lambda row: row.q_short,
+                lambda row: row.a_short,
+                lambda row: row.created_at,
+            ],
+            parent,
+        )
 
 
 class AIDialogsPage(QtWidgets.QWidget):
     def __init__(self, parent: Optional[QtWidgets.QWidget] = None) -> None:
         super().__init__(parent)
-        self._rows: List[dict] = []
+        self._rows: List[LogRow] = []
+        self._page_size = 50
+        self._term = ""
+        self._cursors: List[Optional[int]] = [None]
+        self._pending_cursors: List[Optional[int]] = [None]
+        self._job_id = 0
+        self._search_timer = QtCore.QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(150)
+        self._search_timer.timeout.connect(self.load_logs)
         self._setup_ui()
         self.load_logs()
 
@@ -22,13 +73,20 @@ class AIDialogsPage(QtWidgets.QWidget):
         header_layout = QtWidgets.QHBoxLayout()
         self.search_input = QtWidgets.QLineEdit()
         self.search_input.setPlaceholderText("Поиск по вопросу")
-        self.search_input.returnPressed.connect(self.load_logs)
+        self.search_input.textChanged.connect(self._schedule_load)
+        self.search_input.returnPressed.connect(self._schedule_load)
         search_btn = QtWidgets.QPushButton("Поиск")
-        search_btn.clicked.connect(self.load_logs)
+        search_btn.clicked.connect(self._schedule_load)
         add_btn = QtWidgets.QPushButton("Добавить тестовую запись")
         add_btn.clicked.connect(self._open_add_dialog)
         header_layout.addWidget(self.search_input)
         header_layout.addWidget(search_btn)
+        self.prev_btn = QtWidgets.QPushButton("Назад")
+        self.prev_btn.clicked.connect(self._prev_page)
+        self.next_btn = QtWidgets.QPushButton("Далее")
+        self.next_btn.clicked.connect(self._next_page)
+        header_layout.addWidget(self.prev_btn)
+        header_layout.addWidget(self.next_btn)
         header_layout.addStretch()
         header_layout.addWidget(add_btn)
 
@@ -38,8 +96,7 @@ class AIDialogsPage(QtWidgets.QWidget):
         self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.table.verticalHeader().setVisible(False)
         self.table.horizontalHeader().setStretchLastSection(True)
-        self.model = QtGui.QStandardItemModel(0, 5)
-        self.model.setHorizontalHeaderLabels(["ID", "User ID", "Вопрос", "Ответ", "Создано"])
+        self.model = AILogsModel(self)
         self.table.setModel(self.model)
         self.table.selectionModel().selectionChanged.connect(self._update_preview)
 
@@ -57,40 +114,49 @@ class AIDialogsPage(QtWidgets.QWidget):
         layout.addWidget(self.table)
         layout.addLayout(preview_layout)
 
+    def _schedule_load(self) -> None:
+        self._search_timer.start()
+
     def load_logs(self) -> None:
-        term = self.search_input.text().strip()
-        where = None
-        params: List[str] = []
-        if term:
-            where = "question LIKE ?"
-            params = [f"%{term}%"]
-        try:
-            self._rows = db.select_all("ai_logs", where, params, order_by="id DESC", limit=500)
-        except sqlite3.Error as exc:
-            QtWidgets.QMessageBox.critical(self, "Ошибка загрузки", str(exc))
+        self._term = self.search_input.text().strip()
+        self._request_page([None])
+
+    def _next_page(self) -> None:
+        if not self._rows:
+            return
+        self._request_page(self._cursors + [self._rows[-1].id])
+
+    def _prev_page(self) -> None:
+        if len(self._cursors) < 2:
             return
-        self.model.setRowCount(0)
-        for row in self._rows:
-            items = [
-                QtGui.QStandardItem(str(row.get("id"))),
-                QtGui.QStandardItem(str(row.get("user_id")) if row.get("user_id") is not None else ""),
-                QtGui.QStandardItem(self._short_text(row.get("question"))),
-                QtGui.QStandardItem(self._short_text(row.get("answer"))),
-                QtGui.QStandardItem(row.get("created_at") or ""),
-            ]
-            for item in items:
-                item.setEditable(False)
-            self.model.appendRow(items)
+        self._request_page(self._cursors[:-1])
+
+    def _request_page(self, cursors: List[Optional[int]]) -> None:
+        self._job_id += 1
+        self._pending_cursors = cursors
+        job = LogsQueryJob(self._job_id, cursors[-1], self._term or None, self._page_size + 1)
+        job.signals.finished.connect(self._on_page_loaded)
+        job.signals.failed.connect(self._on_page_failed)
+        QtCore.QThreadPool.globalInstance().start(job)
+
+    def _on_page_loaded(self, job_id: int, rows: List[db.Record]) -> None:
+        if job_id != self._job_id:
+            return
+        self._cursors = self._pending_cursors
+        self.prev_btn.setEnabled(len(self._cursors) > 1)
+        self.next_btn.setEnabled(len(rows) > self._page_size)
+        self._rows = [_to_log_row(row) for row in rows[: self._page_size]]
+        self.table.clearSelection()
+        self.model.update_rows(self._rows)
         self.question_preview.clear()
         self.answer_preview.clear()
 
-    def _short_text(self, value: Optional[str], limit: int = 80) -> str:
-        if not value:
-            return ""
-        value = value.strip()
-        return value if len(value) <= limit else value[: limit - 1] + "…"
+    def _on_page_failed(self, job_id: int, message: str) -> None:
+        if job_id != self._job_id:
+            return
+        QtWidgets.QMessageBox.critical(self, "Ошибка загрузки", message)
 
-    def _select_current(self) -> Optional[dict]:
+    def _select_current(self) -> Optional[LogRow]:
         indexes = self.table.selectionModel().selectedRows()
         if not indexes:
             return None
@@ -105,10 +171,11 @@ class AIDialogsPage(QtWidgets.QWidget):
             self.question_preview.clear()
             self.answer_preview.clear()
             return
-        self.question_preview.setPlainText(record.get("question") or "")
-        self.answer_preview.setPlainText(record.get("answer") or "")
+        self.question_preview.setPlainText(record.question)
+        self.answer_preview.setPlainText(record.answer)
 
     def _open_add_dialog(self) -> None:
         dialog = AIDialogAddForm(parent=self)
-        dialog.saved.connect(self.load_logs)
-        dialog.exec_()
+        dialog.saved.connect(self._schedule_load)
+        dialog.finished.connect(dialog.deleteLater)
+        dialog.open()
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+DIALOG_COLUMNS = ("id", "name", "description", "is_active", "created_at")
+DIALOG_ID, DIALOG_NAME, DIALOG_DESCRIPTION, DIALOG_IS_ACTIVE, DIALOG_CREATED_AT = range(len(DIALOG_COLUMNS))
+
+QUESTION_COLUMNS = ("id", "question", "type", "is_active")
+QUESTION_ID, QUESTION_TEXT, QUESTION_TYPE, QUESTION_IS_ACTIVE = range(len(QUESTION_COLUMNS))
+
+FEEDBACK_COLUMNS = ("id", "question", "answer", "liked")
+FEEDBACK_ID, FEEDBACK_QUESTION, FEEDBACK_ANSWER, FEEDBACK_LIKED = range(len(FEEDBACK_COLUMNS))
+
+RESTAURANT_COLUMNS = ("id", "name", "city", "cuisine", "rating")
+RESTAURANT_ID, RESTAURANT_NAME, RESTAURANT_CITY, RESTAURANT_CUISINE, RESTAURANT_RATING = range(
+    len(RESTAURANT_COLUMNS)
+)
+
+ACTIVE_LABELS = {0: "Нет", 1: "Да", None: "Да"}
+LIKED_LABELS = {0: "👎", 1: "👍", None: "👎"}
@@ -1,31 +1,151 @@
 from __future__ import annotations
 
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import db as core_db
+
+from .columns import DIALOG_COLUMNS, QUESTION_COLUMNS, RESTAURANT_COLUMNS
+from .security import hash_password, is_hashed
 
 DB_PATH = (Path(__file__).resolve().parent.parent / "foodmate.db").resolve()
 ALLOWED_TABLES = {"qa", "ai_logs", "ai_feedback", "restaurants", "dialogs", "dialog_questions", "admins"}
 
+_CONN_PRAGMAS = (
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=10000",
+    "PRAGMA mmap_size=268435456",
+)
+
+_READ_POOL: "queue.SimpleQueue[sqlite3.Connection]" = queue.SimpleQueue()
+_write_lock = threading.Lock()
+_write_conn: Optional[sqlite3.Connection] = None
+_tx_state = threading.local()
+
+
+class Record(sqlite3.Row):
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except IndexError:
+            return default
 
-def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(str(DB_PATH), timeout=15, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys=ON")
+
+def _open_conn() -> sqlite3.Connection:
+    conn = sqlite3.connect(str(DB_PATH), timeout=15, check_same_thread=False, cached_statements=256)
+    conn.row_factory = Record
+    for pragma in _CONN_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
-def _ensure_column(conn: sqlite3.Connection, table: str, column: str, ddl: str) -> None:
-    info = conn.execute(f"PRAGMA table_info({table})").fetchall()
-    if column not in {row[1] for row in info}:
-        conn.execute(ddl)
+@contextmanager
+def read_conn() -> Iterator[sqlite3.Connection]:
+    try:
+        conn = _READ_POOL.get_nowait()
+    except queue.Empty:
+        conn = _open_conn()
+    try:
+        yield conn
+    finally:
+        _READ_POOL.put(conn)
+
+
+def _writer() -> sqlite3.Connection:
+    global _write_conn
+    if _write_conn is None:
+        _write_conn = _open_conn()
+    return _write_conn
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    active = getattr(_tx_state, "conn", None)
+    if active is not None:
+        yield active
+        return
+    with _write_lock:
+        conn = _writer()
+        conn.execute("BEGIN IMMEDIATE")
+        _tx_state.conn = conn
+        try:
+            with db_transaction(conn):
+                yield conn
+        finally:
+            _tx_state.conn = None
+
+
+@contextmanager
+def write_conn() -> Iterator[sqlite3.Connection]:
+    active = getattr(_tx_state, "conn", None)
+    if active is not None:
+        yield active
+        return
+    with _write_lock:
+        with db_transaction(_writer()) as conn:
+            yield conn
+
+
+@contextmanager
+def db_transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def _ensure_fts(conn: sqlite3.Connection, table: str, columns: Sequence[str], tokenize: str) -> None:
+    fts = f"{table}_fts"
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (fts,)).fetchone()
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    conn.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} "
+        f"USING fts5({cols}, content='{table}', content_rowid='id', tokenize='{tokenize}')"
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values});
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values});
+        END
+        """
+    )
+    if not exists:
+        conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
 
 
 def init_db() -> None:
-    with get_conn() as conn:
-        conn.execute("PRAGMA journal_mode=WAL")
-        _ensure_column(conn, "qa", "type", "ALTER TABLE qa ADD COLUMN type TEXT")
-        _ensure_column(conn, "qa", "is_active", "ALTER TABLE qa ADD COLUMN is_active INTEGER DEFAULT 1")
+    # Base tables, column migrations and bot indexes are defined once, in the bot's db module.
+    with write_conn() as conn:
+        core_db.init_schema(conn)
+    with transaction() as conn:
         conn.execute("UPDATE qa SET type = COALESCE(type, 'general') WHERE type IS NULL")
         conn.execute("UPDATE qa SET is_active = 1 WHERE is_active IS NULL")
         conn.execute(
@@ -62,9 +182,33 @@ def init_db() -> None:
         conn.execute(
             "CREATE INDEX IF NOT EXISTS idx_dialog_questions_dialog ON dialog_questions(dialog_id, order_num)"
         )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_qa_active_id ON qa(is_active, id DESC)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_feedback_liked ON ai_feedback(liked, id DESC)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_dialogs_name ON dialogs(name)")
+        _ensure_fts(conn, "ai_logs", ("question",), "trigram")
+        _ensure_fts(conn, "dialogs", ("name", "description"), "unicode61")
+        _ensure_fts(conn, "qa", ("question",), "unicode61")
+        _ensure_fts(conn, "restaurants", ("name", "city", "cuisine"), "unicode61")
         has_admin = conn.execute("SELECT COUNT(1) FROM admins").fetchone()[0]
         if not has_admin:
-            conn.execute("INSERT OR IGNORE INTO admins(login, password) VALUES (?, ?)", ("admin", "admin"))
+            conn.execute(
+                "INSERT OR IGNORE INTO admins(login, password) VALUES (?, ?)", ("admin", hash_password("admin"))
+            )
+        plain_admins = [
+            (hash_password(row["password"]), row["login"])
+            for row in conn.execute("SELECT login, password FROM admins")
+            if not is_hashed(row["password"])
+        ]
+        if plain_admins:
+            conn.executemany("UPDATE admins SET password=? WHERE login=?", plain_admins)
+        analyzed = conn.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone()
+        if not analyzed:
+            conn.execute("ANALYZE")
+
+
+def like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
 
 
 def _validate_table(table: str) -> None:
@@ -72,6 +216,29 @@ def _validate_table(table: str) -> None:
         raise ValueError(f"Access to table '{table}' is not allowed")
 
 
+@lru_cache(maxsize=128)
+def _select_sql(
+    table: str,
+    columns: Optional[Sequence[str]],
+    where: Optional[str],
+    order_by: Optional[str],
+    limited: bool,
+    offset: bool,
+) -> str:
+    query = f"SELECT {', '.join(columns) if columns else '*'} FROM {table}"
+    if where:
+        query += f" WHERE {where}"
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    if limited:
+        query += " LIMIT ?"
+    elif offset:
+        query += " LIMIT -1"
+    if offset:
+        query += " OFFSET ?"
+    return query
+
+
 def select_all(
     table: str,
     where: Optional[str] = None,
@@ -79,95 +246,207 @@ def select_all(
     *,
     order_by: Optional[str] = None,
     limit: Optional[int] = None,
-) -> List[Dict[str, Any]]:
+    offset: Optional[int] = None,
+    columns: Optional[Sequence[str]] = None,
+) -> List[Record]:
     _validate_table(table)
-    query = f"SELECT * FROM {table}"
-    if where:
-        query += f" WHERE {where}"
-    if order_by:
-        query += f" ORDER BY {order_by}"
+    query = _select_sql(table, tuple(columns) if columns else None, where, order_by, limit is not None, bool(offset))
+    values: List[Any] = list(params or [])
     if limit is not None:
-        query += f" LIMIT {int(limit)}"
-    with get_conn() as conn:
-        cur = conn.execute(query, params or [])
-        return [dict(row) for row in cur.fetchall()]
+        values.append(int(limit))
+    if offset:
+        values.append(int(offset))
+    with read_conn() as conn:
+        cur = conn.execute(query, values)
+        return cur.fetchall()
 
 
-def select_one(table: str, where: str, params: Sequence[Any]) -> Optional[Dict[str, Any]]:
+def select_one(table: str, where: str, params: Sequence[Any]) -> Optional[Record]:
     results = select_all(table, where, params, limit=1)
     return results[0] if results else None
 
 
-def insert(table: str, data: Dict[str, Any]) -> int:
+def _insert_sql(table: str, columns: Sequence[str]) -> str:
     _validate_table(table)
-    columns = ",".join(data.keys())
-    placeholders = ",".join(["?"] * len(data))
-    query = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+    placeholders = ",".join(["?"] * len(columns))
+    return f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})"
+
+
+def insert(table: str, data: Dict[str, Any]) -> int:
+    query = _insert_sql(table, list(data))
     values = list(data.values())
-    with get_conn() as conn:
+    with write_conn() as conn:
         cursor = conn.execute(query, values)
         return cursor.lastrowid
 
 
+def insert_many(table: str, rows: Sequence[Dict[str, Any]]) -> int:
+    if not rows:
+        return 0
+    columns = list(rows[0])
+    query = _insert_sql(table, columns)
+    values = [tuple(row[column] for column in columns) for row in rows]
+    with transaction() as conn:
+        conn.executemany(query, values)
+    return len(values)
+
+
 def update(table: str, data: Dict[str, Any], where: str, params: Sequence[Any]) -> None:
     _validate_table(table)
     assignments = ",".join([f"{column}=?" for column in data])
     query = f"UPDATE {table} SET {assignments} WHERE {where}"
     values: List[Any] = list(data.values()) + list(params)
-    with get_conn() as conn:
+    with write_conn() as conn:
         conn.execute(query, values)
 
 
 def delete(table: str, where: str, params: Sequence[Any]) -> None:
     _validate_table(table)
     query = f"DELETE FROM {table} WHERE {where}"
-    with get_conn() as conn:
+    with write_conn() as conn:
         conn.execute(query, list(params))
 
 
-def fetch_dialog_questions(dialog_id: int) -> List[Dict[str, Any]]:
-    query = (
-        "SELECT dq.dialog_id, dq.question_id, dq.order_num, q.question, q.type, q.is_active "
-        "FROM dialog_questions dq "
-        "JOIN qa q ON q.id = dq.question_id "
-        "WHERE dq.dialog_id=? ORDER BY dq.order_num"
-    )
-    with get_conn() as conn:
-        cur = conn.execute(query, (dialog_id,))
-        return [dict(row) for row in cur.fetchall()]
+_DIALOG_QUESTIONS_SQL = (
+    "SELECT dq.dialog_id, dq.question_id, dq.order_num, q.question, q.type, q.is_active "
+    "FROM dialog_questions dq "
+    "JOIN qa q ON q.id = dq.question_id "
+    "WHERE dq.dialog_id=? ORDER BY dq.order_num"
+)
+_QA_ACTIVE_SQL = "SELECT * FROM qa WHERE is_active=1 ORDER BY id DESC"
+_QA_ACTIVE_LIKE_SQL = (
+    "SELECT * FROM qa WHERE is_active=1 AND question LIKE ? ESCAPE '\\' ORDER BY id DESC"
+)
+_AI_LOGS_PAGE_SQL = "SELECT * FROM ai_logs WHERE id < ? ORDER BY id DESC LIMIT ?"
+_AI_LOGS_PAGE_LIKE_SQL = (
+    "SELECT * FROM ai_logs WHERE id < ? AND question LIKE ? ESCAPE '\\' ORDER BY id DESC LIMIT ?"
+)
+_AI_LOGS_PAGE_FTS_SQL = (
+    "SELECT a.* FROM ai_logs a "
+    "JOIN ai_logs_fts f ON f.rowid = a.id "
+    "WHERE ai_logs_fts MATCH ? AND a.id < ? ORDER BY a.id DESC LIMIT ?"
+)
+_MAX_ROWID = 2**63 - 1
 
 
-def next_order_num(dialog_id: int) -> int:
-    with get_conn() as conn:
-        row = conn.execute(
-            "SELECT COALESCE(MAX(order_num), 0) + 1 AS next_val FROM dialog_questions WHERE dialog_id=?",
-            (dialog_id,),
-        ).fetchone()
-        if row is None:
-            return 1
-        return int(row["next_val"] if isinstance(row, sqlite3.Row) else row[0])
+def fetch_dialog_questions(dialog_id: int) -> List[Record]:
+    with read_conn() as conn:
+        return conn.execute(_DIALOG_QUESTIONS_SQL, (dialog_id,)).fetchall()
 
 
-def swap_order(dialog_id: int, question_id_a: int, question_id_b: int) -> None:
-    with get_conn() as conn:
-        row = conn.execute(
-            "SELECT order_num FROM dialog_questions WHERE dialog_id=? AND question_id=?",
-            (dialog_id, question_id_a),
-        ).fetchone()
-        other = conn.execute(
-            "SELECT order_num FROM dialog_questions WHERE dialog_id=? AND question_id=?",
-            (dialog_id, question_id_b),
-        ).fetchone()
-        if not row or not other:
-            return
-        conn.execute(
-            "UPDATE dialog_questions SET order_num=? WHERE dialog_id=? AND question_id=?",
-            (other["order_num"], dialog_id, question_id_a),
-        )
+def fetch_qa_active(term: Optional[str] = None) -> List[Record]:
+    with read_conn() as conn:
+        if term:
+            return conn.execute(_QA_ACTIVE_LIKE_SQL, (like_pattern(term),)).fetchall()
+        return conn.execute(_QA_ACTIVE_SQL).fetchall()
+
+
+def fetch_ai_logs_page(before_id: Optional[int], term: Optional[str] = None, size: int = 50) -> List[Record]:
+    cursor_id = _MAX_ROWID if before_id is None else before_id
+    with read_conn() as conn:
+        if not term:
+            return conn.execute(_AI_LOGS_PAGE_SQL, (cursor_id, size)).fetchall()
+        # The trigram tokenizer cannot match needles shorter than three characters.
+        if len(term) < 3:
+            return conn.execute(_AI_LOGS_PAGE_LIKE_SQL, (cursor_id, like_pattern(term), size)).fetchall()
+        phrase = '"' + term.replace('"', '""') + '"'
+        return conn.execute(_AI_LOGS_PAGE_FTS_SQL, (phrase, cursor_id, size)).fetchall()
+
+
+_DIALOG_SELECT = "SELECT " + ", ".join(f"d.{column}" for column in DIALOG_COLUMNS) + " FROM dialogs d"
+_DIALOGS_ALL_SQL = f"{_DIALOG_SELECT} ORDER BY d.id DESC"
+_DIALOGS_MATCH_SQL = (
+    f"{_DIALOG_SELECT} JOIN dialogs_fts f ON f.rowid = d.id "
+    "WHERE dialogs_fts MATCH ? ORDER BY d.id DESC"
+)
+_DIALOGS_LIKE_SQL = (
+    f"{_DIALOG_SELECT} WHERE d.name LIKE ? ESCAPE '\\' OR d.description LIKE ? ESCAPE '\\' ORDER BY d.id DESC"
+)
+_QUESTION_SELECT = "SELECT " + ", ".join(f"q.{column}" for column in QUESTION_COLUMNS) + " FROM qa q"
+_QA_ALL_SQL = f"{_QUESTION_SELECT} ORDER BY q.id DESC"
+_QA_MATCH_SQL = f"{_QUESTION_SELECT} JOIN qa_fts f ON f.rowid = q.id WHERE qa_fts MATCH ? ORDER BY q.id DESC"
+_QA_LIKE_SQL = f"{_QUESTION_SELECT} WHERE q.question LIKE ? ESCAPE '\\' ORDER BY q.id DESC"
+
+_RESTAURANTS_LIMIT = 500
+_RESTAURANT_SELECT = "SELECT " + ", ".join(f"r.{column}" for column in RESTAURANT_COLUMNS) + " FROM restaurants r"
+_RESTAURANTS_ALL_SQL = f"{_RESTAURANT_SELECT} ORDER BY r.id DESC LIMIT ?"
+_RESTAURANTS_MATCH_SQL = (
+    f"{_RESTAURANT_SELECT} JOIN restaurants_fts f ON f.rowid = r.id "
+    "WHERE restaurants_fts MATCH ? ORDER BY r.id DESC LIMIT ?"
+)
+_RESTAURANTS_LIKE_SQL = (
+    f"{_RESTAURANT_SELECT} WHERE r.name LIKE ? ESCAPE '\\' OR r.city LIKE ? ESCAPE '\\' "
+    "ORDER BY r.id DESC LIMIT ?"
+)
+
+
+def _prefix_match(term: str) -> str:
+    return " ".join('"' + token.replace('"', '""') + '"*' for token in term.split())
+
+
+def search_dialogs(term: str) -> List[Record]:
+    with read_conn() as conn:
+        if not term:
+            return conn.execute(_DIALOGS_ALL_SQL).fetchall()
+        try:
+            return conn.execute(_DIALOGS_MATCH_SQL, (_prefix_match(term),)).fetchall()
+        except sqlite3.OperationalError:
+            pattern = like_pattern(term)
+            return conn.execute(_DIALOGS_LIKE_SQL, (pattern, pattern)).fetchall()
+
+
+def search_questions(term: str) -> List[Record]:
+    with read_conn() as conn:
+        if not term:
+            return conn.execute(_QA_ALL_SQL).fetchall()
+        try:
+            return conn.execute(_QA_MATCH_SQL, (_prefix_match(term),)).fetchall()
+        except sqlite3.OperationalError:
+            return conn.execute(_QA_LIKE_SQL, (like_pattern(term),)).fetchall()
+
+
+def search_restaurants(term: str) -> List[Record]:
+    with read_conn() as conn:
+        if not term:
+            return conn.execute(_RESTAURANTS_ALL_SQL, (_RESTAURANTS_LIMIT,)).fetchall()
+        try:
+            return conn.execute(
+                _RESTAURANTS_MATCH_SQL, (f"{{name city}} : ({_prefix_match(term)})", _RESTAURANTS_LIMIT)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            pattern = like_pattern(term)
+            return conn.execute(_RESTAURANTS_LIKE_SQL, (pattern, pattern, _RESTAURANTS_LIMIT)).fetchall()
+
+
+def add_dialog_question(dialog_id: int, question_id: int) -> None:
+    with write_conn() as conn:
         conn.execute(
-            "UPDATE dialog_questions SET order_num=? WHERE dialog_id=? AND question_id=?",
-            (row["order_num"], dialog_id, question_id_b),
+            "INSERT INTO dialog_questions(dialog_id, question_id, order_num) "
+            "SELECT ?, ?, COALESCE(MAX(order_num), 0) + 1 FROM dialog_questions WHERE dialog_id=?",
+            (dialog_id, question_id, dialog_id),
         )
 
 
-init_db()
+def swap_order(dialog_id: int, question_id_a: int, question_id_b: int) -> None:
+    with write_conn() as conn:
+        orders = dict(
+            conn.execute(
+                "SELECT question_id, order_num FROM dialog_questions WHERE dialog_id=? AND question_id IN (?, ?)",
+                (dialog_id, question_id_a, question_id_b),
+            ).fetchall()
+        )
+        if question_id_a not in orders or question_id_b not in orders:
+            return
+        conn.execute(
+            "UPDATE dialog_questions SET order_num = CASE question_id WHEN ? THEN ? WHEN ? THEN ? END "
+            "WHERE dialog_id=? AND question_id IN (?, ?)",
+            (
+                question_id_a,
+                orders[question_id_b],
+                question_id_b,
+                orders[question_id_a],
+                dialog_id,
+                question_id_a,
+                question_id_b,
+            ),
+        )
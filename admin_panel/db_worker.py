@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import Any, Callable, List, Optional, Sequence
+
+from PyQt5 import QtCore
+
+from . import db
+
+
+class JobSignals(QtCore.QObject):
+    finished = QtCore.pyqtSignal(int, list)
+    failed = QtCore.pyqtSignal(int, str)
+
+
+class QueryJob(QtCore.QRunnable):
+    def __init__(self, job_id: int, query: Callable[..., List[Any]], *args: Any, **kwargs: Any) -> None:
+        super().__init__()
+        self.job_id = job_id
+        self._query = query
+        self._args = args
+        self._kwargs = kwargs
+        self.signals = JobSignals()
+
+    def run(self) -> None:
+        # Reads borrow a pooled connection, so workers never share one across threads.
+        try:
+            rows = self._query(*self._args, **self._kwargs)
+        except sqlite3.Error as exc:
+            self.signals.failed.emit(self.job_id, str(exc))
+            return
+        self.signals.finished.emit(self.job_id, rows)
+
+
+class LogsQueryJob(QueryJob):
+    def __init__(self, job_id: int, before_id: Optional[int], term: Optional[str], size: int) -> None:
+        super().__init__(job_id, db.fetch_ai_logs_page, before_id, term, size)
+
+
+class SelectRunnable(QueryJob):
+    def __init__(
+        self,
+        job_id: int,
+        table: str,
+        where: Optional[str] = None,
+        params: Optional[Sequence[Any]] = None,
+        *,
+        order_by: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        columns: Optional[Sequence[str]] = None,
+    ) -> None:
+        super().__init__(
+            job_id,
+            db.select_all,
+            table,
+            where,
+            list(params or []),
+            order_by=order_by,
+            limit=limit,
+            offset=offset,
+            columns=columns,
+        )
@@ -11,7 +11,7 @@ from . import db
 class DialogForm(QtWidgets.QDialog):
     saved = QtCore.pyqtSignal()
 
-    def __init__(self, dialog: Optional[dict] = None, parent: Optional[QtWidgets.QWidget] = None) -> None:
+    def __init__(self, dialog: Optional[db.Record] = None, parent: Optional[QtWidgets.QWidget] = None) -> None:
         super().__init__(parent)
         self.dialog = dialog
         self.setWindowTitle("Редактирование диалога" if dialog else "Новый диалог")
@@ -44,7 +44,7 @@ class DialogForm(QtWidgets.QDialog):
         if dialog:
             self._fill_form(dialog)
 
-    def _fill_form(self, dialog: dict) -> None:
+    def _fill_form(self, dialog: db.Record) -> None:
         self.name_input.setText(dialog.get("name", ""))
         self.description_edit.setPlainText(dialog.get("description", "") or "")
         self.active_checkbox.setChecked(bool(dialog.get("is_active", 1)))
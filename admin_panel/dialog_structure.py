@@ -3,9 +3,11 @@ from __future__ import annotations
 import sqlite3
 from typing import List, Optional
 
-from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5 import QtCore, QtWidgets
 
 from . import db
+from .columns import ACTIVE_LABELS
+from .table_models import RowsTableModel
 
 
 class DialogStructurePage(QtWidgets.QWidget):
@@ -13,8 +15,12 @@ class DialogStructurePage(QtWidgets.QWidget):
         super().__init__(parent)
         self.dialog_id: Optional[int] = None
         self.dialog_name: str = ""
-        self._all_questions: List[dict] = []
-        self._dialog_questions: List[dict] = []
+        self._all_questions: List[db.Record] = []
+        self._dialog_questions: List[db.Record] = []
+        self._search_timer = QtCore.QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(150)
+        self._search_timer.timeout.connect(self._load_all_questions)
         self._setup_ui()
 
     def _setup_ui(self) -> None:
@@ -37,9 +43,10 @@ class DialogStructurePage(QtWidgets.QWidget):
         search_layout = QtWidgets.QHBoxLayout()
         self.search_input = QtWidgets.QLineEdit()
         self.search_input.setPlaceholderText("Поиск вопросов")
-        self.search_input.returnPressed.connect(self._load_all_questions)
+        self.search_input.textChanged.connect(self._schedule_search)
+        self.search_input.returnPressed.connect(self._schedule_search)
         search_btn = QtWidgets.QPushButton("Поиск")
-        search_btn.clicked.connect(self._load_all_questions)
+        search_btn.clicked.connect(self._schedule_search)
         search_layout.addWidget(self.search_input)
         search_layout.addWidget(search_btn)
         left_layout.addLayout(search_layout)
@@ -50,8 +57,16 @@ class DialogStructurePage(QtWidgets.QWidget):
         self.all_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.all_table.verticalHeader().setVisible(False)
         self.all_table.horizontalHeader().setStretchLastSection(True)
-        self.all_model = QtGui.QStandardItemModel(0, 4)
-        self.all_model.setHorizontalHeaderLabels(["ID", "Вопрос", "Тип", "Активен"])
+        self.all_model = RowsTableModel(
+            ["ID", "Вопрос", "Тип", "Активен"],
+            [
+                lambda row: str(row.get("id")),
+                lambda row: row.get("question") or "",
+                lambda row: row.get("type") or "",
+                lambda row: ACTIVE_LABELS.get(row.get("is_active", 1), "Да"),
+            ],
+            self,
+        )
         self.all_table.setModel(self.all_model)
         left_layout.addWidget(self.all_table)
 
@@ -76,8 +91,16 @@ class DialogStructurePage(QtWidgets.QWidget):
         self.dialog_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.dialog_table.verticalHeader().setVisible(False)
         self.dialog_table.horizontalHeader().setStretchLastSection(True)
-        self.dialog_model = QtGui.QStandardItemModel(0, 4)
-        self.dialog_model.setHorizontalHeaderLabels(["№", "ID", "Вопрос", "Тип"])
+        self.dialog_model = RowsTableModel(
+            ["№", "ID", "Вопрос", "Тип"],
+            [
+                lambda row: str(row.get("order_num")),
+                lambda row: str(row.get("question_id")),
+                lambda row: row.get("question") or "",
+                lambda row: row.get("type") or "",
+            ],
+            self,
+        )
         self.dialog_table.setModel(self.dialog_model)
         right_layout.addWidget(self.dialog_table)
 
@@ -110,53 +133,33 @@ class DialogStructurePage(QtWidgets.QWidget):
         self._load_all_questions()
         self._load_dialog_questions()
 
+    def _schedule_search(self) -> None:
+        self._search_timer.start()
+
     def _load_all_questions(self) -> None:
         term = self.search_input.text().strip()
-        where = "is_active=1"
-        params: List[str] = []
-        if term:
-            where += " AND question LIKE ?"
-            params.append(f"%{term}%")
         try:
-            self._all_questions = db.select_all("qa", where, params, order_by="id DESC")
+            self._all_questions = db.fetch_qa_active(term)
         except sqlite3.Error as exc:
             QtWidgets.QMessageBox.critical(self, "Ошибка загрузки", str(exc))
             return
-        self.all_model.setRowCount(0)
-        for row in self._all_questions:
-            items = [
-                QtGui.QStandardItem(str(row.get("id"))),
-                QtGui.QStandardItem(row.get("question") or ""),
-                QtGui.QStandardItem(row.get("type") or ""),
-                QtGui.QStandardItem("Да" if row.get("is_active", 1) else "Нет"),
-            ]
-            for item in items:
-                item.setEditable(False)
-            self.all_model.appendRow(items)
+        self.all_table.clearSelection()
+        self.all_model.update_rows(self._all_questions)
 
     def _load_dialog_questions(self) -> None:
         if not self.dialog_id:
-            self.dialog_model.setRowCount(0)
             self._dialog_questions = []
+            self.dialog_model.update_rows(self._dialog_questions)
             return
         try:
             self._dialog_questions = db.fetch_dialog_questions(self.dialog_id)
         except sqlite3.Error as exc:
             QtWidgets.QMessageBox.critical(self, "Ошибка загрузки", str(exc))
             return
-        self.dialog_model.setRowCount(0)
-        for row in self._dialog_questions:
-            items = [
-                QtGui.QStandardItem(str(row.get("order_num"))),
-                QtGui.QStandardItem(str(row.get("question_id"))),
-                QtGui.QStandardItem(row.get("question") or ""),
-                QtGui.QStandardItem(row.get("type") or ""),
-            ]
-            for item in items:
-                item.setEditable(False)
-            self.dialog_model.appendRow(items)
-
-    def _selected_all_question(self) -> Optional[dict]:
+        self.dialog_table.clearSelection()
+        self.dialog_model.update_rows(self._dialog_questions)
+
+    def _selected_all_question(self) -> Optional[db.Record]:
         indexes = self.all_table.selectionModel().selectedRows()
         if not indexes:
             return None
@@ -165,7 +168,7 @@ class DialogStructurePage(QtWidgets.QWidget):
             return self._all_questions[idx]
         return None
 
-    def _selected_dialog_question(self) -> Optional[dict]:
+    def _selected_dialog_question(self) -> Optional[db.Record]:
         indexes = self.dialog_table.selectionModel().selectedRows()
         if not indexes:
             return None
@@ -182,15 +185,11 @@ class DialogStructurePage(QtWidgets.QWidget):
         if not question:
             QtWidgets.QMessageBox.information(self, "Внимание", "Выберите вопрос")
             return
-        if any(row["question_id"] == question["id"] for row in self._dialog_questions):
+        try:
+            db.add_dialog_question(self.dialog_id, question["id"])
+        except sqlite3.IntegrityError:
             QtWidgets.QMessageBox.information(self, "Информация", "Вопрос уже в диалоге")
             return
-        try:
-            order_num = db.next_order_num(self.dialog_id)
-            db.insert(
-                "dialog_questions",
-                {"dialog_id": self.dialog_id, "question_id": question["id"], "order_num": order_num},
-            )
         except sqlite3.Error as exc:
             QtWidgets.QMessageBox.critical(self, "Ошибка БД", str(exc))
             return
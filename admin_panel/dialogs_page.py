@@ -1,12 +1,15 @@
 from __future__ import annotations
 
 import sqlite3
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
-from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5 import QtCore, QtWidgets
 
 from . import db
+from .columns import ACTIVE_LABELS, DIALOG_DESCRIPTION, DIALOG_ID, DIALOG_IS_ACTIVE, DIALOG_NAME
+from .db_worker import QueryJob
 from .dialog_form import DialogForm
+from .table_models import RowsTableModel
 
 
 class DialogsPage(QtWidgets.QWidget):
@@ -14,7 +17,14 @@ class DialogsPage(QtWidgets.QWidget):
 
     def __init__(self, parent: Optional[QtWidgets.QWidget] = None) -> None:
         super().__init__(parent)
-        self._rows: List[dict] = []
+        self._rows: List[db.Record] = []
+        self._generation = 0
+        self._selected_row_cache: Optional[db.Record] = None
+        self._last_query_key: Optional[Tuple[str]] = None
+        self._search_timer = QtCore.QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(150)
+        self._search_timer.timeout.connect(self._search_debounced)
         self._setup_ui()
         self.load_dialogs()
 
@@ -23,9 +33,10 @@ class DialogsPage(QtWidgets.QWidget):
         search_layout = QtWidgets.QHBoxLayout()
         self.search_input = QtWidgets.QLineEdit()
         self.search_input.setPlaceholderText("Поиск по названию")
-        self.search_input.returnPressed.connect(self.load_dialogs)
+        self.search_input.textChanged.connect(self._search_timer.start)
+        self.search_input.returnPressed.connect(self._search_now)
         search_btn = QtWidgets.QPushButton("Поиск")
-        search_btn.clicked.connect(self.load_dialogs)
+        search_btn.clicked.connect(self._search_now)
         search_layout.addWidget(self.search_input)
         search_layout.addWidget(search_btn)
 
@@ -36,9 +47,18 @@ class DialogsPage(QtWidgets.QWidget):
         self.table.verticalHeader().setVisible(False)
         self.table.horizontalHeader().setStretchLastSection(True)
 
-        self.model = QtGui.QStandardItemModel(0, 4)
-        self.model.setHorizontalHeaderLabels(["ID", "Название", "Активен", "Описание"])
+        self.model = RowsTableModel(
+            ["ID", "Название", "Активен", "Описание"],
+            [
+                lambda row: str(row[DIALOG_ID]),
+                lambda row: row[DIALOG_NAME] or "",
+                lambda row: ACTIVE_LABELS.get(row[DIALOG_IS_ACTIVE], "Да"),
+                lambda row: row[DIALOG_DESCRIPTION] or "",
+            ],
+            self,
+        )
         self.table.setModel(self.model)
+        self.table.selectionModel().selectionChanged.connect(self._sync_selection)
 
         buttons_layout = QtWidgets.QHBoxLayout()
         add_btn = QtWidgets.QPushButton("Добавить")
@@ -60,45 +80,59 @@ class DialogsPage(QtWidgets.QWidget):
         layout.addWidget(self.table)
         layout.addLayout(buttons_layout)
 
+    def _search_now(self) -> None:
+        self._search_timer.stop()
+        self.load_dialogs()
+
+    def _search_debounced(self) -> None:
+        # Typing that ends on the already loaded term (e.g. "ab" -> "abc" -> "ab") needs no new query.
+        if (self.search_input.text().strip(),) != self._last_query_key:
+            self.load_dialogs()
+
     def load_dialogs(self) -> None:
         term = self.search_input.text().strip()
-        where = None
-        params: List[str] = []
-        if term:
-            where = "name LIKE ? OR description LIKE ?"
-            term_like = f"%{term}%"
-            params = [term_like, term_like]
-        try:
-            self._rows = db.select_all("dialogs", where, params, order_by="id DESC")
-        except sqlite3.Error as exc:
-            QtWidgets.QMessageBox.critical(self, "Ошибка загрузки", str(exc))
+        self._last_query_key = (term,)
+        self._generation += 1
+        job = QueryJob(self._generation, db.search_dialogs, term)
+        job.signals.finished.connect(self._on_rows_loaded)
+        job.signals.failed.connect(self._on_load_failed)
+        self.table.setEnabled(False)
+        QtCore.QThreadPool.globalInstance().start(job)
+
+    def _on_rows_loaded(self, generation: int, rows: List[db.Record]) -> None:
+        if generation != self._generation:
             return
-
-        self.model.setRowCount(0)
-        for row in self._rows:
-            items = [
-                QtGui.QStandardItem(str(row.get("id"))),
-                QtGui.QStandardItem(row.get("name") or ""),
-                QtGui.QStandardItem("Да" if row.get("is_active", 1) else "Нет"),
-                QtGui.QStandardItem(row.get("description") or ""),
-            ]
-            for item in items:
-                item.setEditable(False)
-            self.model.appendRow(items)
-
-    def _get_selected_row(self) -> Optional[dict]:
-        indexes = self.table.selectionModel().selectedRows()
-        if not indexes:
-            return None
-        idx = indexes[0].row()
-        if 0 <= idx < len(self._rows):
-            return self._rows[idx]
-        return None
+        self.table.setEnabled(True)
+        self._selected_row_cache = None
+        self._rows = rows
+        self.table.clearSelection()
+        self.model.update_rows(self._rows)
+
+    def _on_load_failed(self, generation: int, message: str) -> None:
+        if generation != self._generation:
+            return
+        self._last_query_key = None
+        self.table.setEnabled(True)
+        QtWidgets.QMessageBox.critical(self, "Ошибка загрузки", message)
+
+    def _sync_selection(self, selected: QtCore.QItemSelection, deselected: QtCore.QItemSelection) -> None:
+        # The delta alone misses deselect-while-another-stays and extend cases; read the model's current state.
+        self._selected_row_cache = None
+        selected_rows = self.table.selectionModel().selectedRows()
+        if selected_rows:
+            idx = selected_rows[0].row()
+            rows = self._rows
+            if 0 <= idx < len(rows):
+                self._selected_row_cache = rows[idx]
+
+    def _get_selected_row(self) -> Optional[db.Record]:
+        return self._selected_row_cache
 
     def _open_create(self) -> None:
         dialog = DialogForm(parent=self)
         dialog.saved.connect(self._handle_saved)
-        dialog.exec_()
+        dialog.finished.connect(dialog.deleteLater)
+        dialog.open()
 
     def _open_edit(self) -> None:
         record = self._get_selected_row()
@@ -107,7 +141,8 @@ class DialogsPage(QtWidgets.QWidget):
             return
         dialog = DialogForm(record, parent=self)
         dialog.saved.connect(self._handle_saved)
-        dialog.exec_()
+        dialog.finished.connect(dialog.deleteLater)
+        dialog.open()
 
     def _delete_dialog(self) -> None:
         record = self._get_selected_row()
@@ -123,7 +158,9 @@ class DialogsPage(QtWidgets.QWidget):
         if confirm != QtWidgets.QMessageBox.Yes:
             return
         try:
-            db.delete("dialogs", "id=?", (record["id"],))
+            with db.transaction():
+                db.delete("dialog_questions", "dialog_id=?", (record[DIALOG_ID],))
+                db.delete("dialogs", "id=?", (record[DIALOG_ID],))
         except sqlite3.Error as exc:
             QtWidgets.QMessageBox.critical(self, "Ошибка БД", str(exc))
             return
@@ -134,7 +171,7 @@ class DialogsPage(QtWidgets.QWidget):
         if not record:
             QtWidgets.QMessageBox.information(self, "Внимание", "Выберите диалог")
             return
-        self.open_structure_requested.emit(record)
+        self.open_structure_requested.emit(dict(record))
 
     def _handle_saved(self) -> None:
         self.load_dialogs()
@@ -3,16 +3,29 @@ from __future__ import annotations
 import sqlite3
 from typing import List, Optional
 
-from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5 import QtCore, QtWidgets
 
 from . import db
+from .columns import (
+    FEEDBACK_ANSWER,
+    FEEDBACK_COLUMNS,
+    FEEDBACK_ID,
+    FEEDBACK_LIKED,
+    FEEDBACK_QUESTION,
+    LIKED_LABELS,
+)
+from .db_worker import SelectRunnable
+from .table_models import PagedRowsTableModel
 
 
 class FeedbackPage(QtWidgets.QWidget):
     def __init__(self, parent: Optional[QtWidgets.QWidget] = None) -> None:
         super().__init__(parent)
-        self._rows: List[dict] = []
         self._current_filter = "all"
+        self._page_size = 50
+        self._generation = 0
+        self._selected_row_cache: Optional[db.Record] = None
+        self._preview_id: Optional[int] = None
         self._setup_ui()
         self.load_feedback()
 
@@ -40,9 +53,21 @@ class FeedbackPage(QtWidgets.QWidget):
         self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.table.verticalHeader().setVisible(False)
         self.table.horizontalHeader().setStretchLastSection(True)
-        self.model = QtGui.QStandardItemModel(0, 4)
-        self.model.setHorizontalHeaderLabels(["ID", "Вопрос", "Ответ", "Liked"])
+        self.model = PagedRowsTableModel(
+            ["ID", "Вопрос", "Ответ", "Liked"],
+            [
+                lambda row: str(row[FEEDBACK_ID]),
+                lambda row: (row[FEEDBACK_QUESTION] or "").strip(),
+                lambda row: (row[FEEDBACK_ANSWER] or "").strip(),
+                lambda row: LIKED_LABELS.get(row[FEEDBACK_LIKED], "👍"),
+            ],
+            self._fetch_page,
+            self._page_size,
+            self,
+        )
+        self.model.fetch_failed.connect(self._show_load_error)
         self.table.setModel(self.model)
+        self.table.selectionModel().selectionChanged.connect(self._sync_selection)
         self.table.selectionModel().selectionChanged.connect(self._update_preview)
 
         preview_layout = QtWidgets.QHBoxLayout()
@@ -73,58 +98,95 @@ class FeedbackPage(QtWidgets.QWidget):
             self._current_filter = "all"
         self.load_feedback()
 
-    def load_feedback(self) -> None:
-        where = None
-        params: List[int] = []
+    def _feedback_where(self) -> Optional[str]:
         if self._current_filter == "liked":
-            where = "liked=1"
-        elif self._current_filter == "disliked":
-            where = "liked=0"
-        try:
-            self._rows = db.select_all("ai_feedback", where, params, order_by="id DESC", limit=500)
-        except sqlite3.Error as exc:
-            QtWidgets.QMessageBox.critical(self, "Ошибка загрузки", str(exc))
-            return
-        self.model.setRowCount(0)
-        for row in self._rows:
-            items = [
-                QtGui.QStandardItem(str(row.get("id"))),
-                QtGui.QStandardItem((row.get("question") or "").strip()),
-                QtGui.QStandardItem((row.get("answer") or "").strip()),
-                QtGui.QStandardItem("👍" if row.get("liked") else "👎"),
-            ]
-            for item in items:
-                item.setEditable(False)
-            self.model.appendRow(items)
-        self.question_preview.clear()
-        self.answer_preview.clear()
-
-    def _selected_row(self) -> Optional[dict]:
-        indexes = self.table.selectionModel().selectedRows()
-        if not indexes:
-            return None
-        idx = indexes[0].row()
-        if 0 <= idx < len(self._rows):
-            return self._rows[idx]
+            return "liked=1"
+        if self._current_filter == "disliked":
+            return "liked=0"
         return None
 
+    def _fetch_page(self, offset: int, limit: int) -> List[db.Record]:
+        return db.select_all(
+            "ai_feedback",
+            self._feedback_where(),
+            order_by="id DESC",
+            limit=limit,
+            offset=offset,
+            columns=FEEDBACK_COLUMNS,
+        )
+
+    def load_feedback(self) -> None:
+        self._generation += 1
+        job = SelectRunnable(
+            self._generation,
+            "ai_feedback",
+            self._feedback_where(),
+            order_by="id DESC",
+            limit=self._page_size,
+            columns=FEEDBACK_COLUMNS,
+        )
+        job.signals.finished.connect(self._on_rows_loaded)
+        job.signals.failed.connect(self._on_load_failed)
+        self.table.setEnabled(False)
+        QtCore.QThreadPool.globalInstance().start(job)
+
+    def _on_rows_loaded(self, generation: int, rows: List[db.Record]) -> None:
+        if generation != self._generation:
+            return
+        self.table.setEnabled(True)
+        self.table.clearSelection()
+        self._selected_row_cache = None
+        self.model.set_first_page(rows)
+        self._clear_preview()
+
+    def _on_load_failed(self, generation: int, message: str) -> None:
+        if generation != self._generation:
+            return
+        self.table.setEnabled(True)
+        self._show_load_error(message)
+
+    def _show_load_error(self, message: str) -> None:
+        QtWidgets.QMessageBox.critical(self, "Ошибка загрузки", message)
+
+    def _sync_selection(self, selected: QtCore.QItemSelection, deselected: QtCore.QItemSelection) -> None:
+        # The delta alone misses deselect-while-another-stays and extend cases; read the model's current state.
+        self._selected_row_cache = None
+        selected_rows = self.table.selectionModel().selectedRows()
+        if selected_rows:
+            idx = selected_rows[0].row()
+            rows = self.model.rows()
+            if 0 <= idx < len(rows):
+                self._selected_row_cache = rows[idx]
+
+    def _selected_row(self) -> Optional[db.Record]:
+        return self._selected_row_cache
+
+    def _clear_preview(self) -> None:
+        self._preview_id = None
+        if self.question_preview.toPlainText():
+            self.question_preview.clear()
+        if self.answer_preview.toPlainText():
+            self.answer_preview.clear()
+
     def _update_preview(self) -> None:
         record = self._selected_row()
         if not record:
-            self.question_preview.clear()
-            self.answer_preview.clear()
+            self._clear_preview()
+            return
+        if record[FEEDBACK_ID] == self._preview_id:
             return
-        self.question_preview.setPlainText(record.get("question") or "")
-        self.answer_preview.setPlainText(record.get("answer") or "")
+        self._preview_id = record[FEEDBACK_ID]
+        self.question_preview.setPlainText(record[FEEDBACK_QUESTION] or "")
+        self.answer_preview.setPlainText(record[FEEDBACK_ANSWER] or "")
 
     def _toggle_like(self) -> None:
         record = self._selected_row()
         if not record:
             QtWidgets.QMessageBox.information(self, "Внимание", "Выберите запись")
             return
-        new_value = 0 if record.get("liked") else 1
+        new_value = 0 if record[FEEDBACK_LIKED] else 1
         try:
-            db.update("ai_feedback", {"liked": new_value}, "id=?", (record["id"],))
+            db.update("ai_feedback", {"liked": new_value}, "id=?", (record[FEEDBACK_ID],))
         except sqlite3.Error as exc:
             QtWidgets.QMessageBox.critical(self, "Ошибка БД", str(exc))
             return
@@ -1,11 +1,19 @@
 from __future__ import annotations
 
+import secrets
 import sqlite3
-from typing import Optional
+import time
+from typing import Dict, Optional, Tuple
 
 from PyQt5 import QtCore, QtWidgets
 
 from . import db
+from .security import hash_password, needs_rehash, verify_password
+
+_FAILURE_COOLDOWN = 1.0
+_ADMIN_CACHE_TTL = 30.0
+# Verified against when the login is unknown, so a miss costs the same PBKDF2 run as a wrong password.
+_DUMMY_HASH = hash_password(secrets.token_hex(16))
 
 
 class LoginWindow(QtWidgets.QWidget):
@@ -15,6 +23,8 @@ class LoginWindow(QtWidgets.QWidget):
         super().__init__()
         self.setWindowTitle("FindFood Admin — вход")
         self.resize(360, 220)
+        self._last_failure_ts = 0.0
+        self._admin_cache: Dict[str, Tuple[float, db.Record]] = {}
         self._setup_ui()
 
     def _setup_ui(self) -> None:
@@ -53,13 +63,36 @@ class LoginWindow(QtWidgets.QWidget):
         if not login or not password:
             self.error_label.setText("Введите логин и пароль")
             return
+        now = time.monotonic()
+        if now - self._last_failure_ts < _FAILURE_COOLDOWN:
+            self.error_label.setText("Слишком частые попытки, подождите")
+            return
         try:
-            admin = db.select_one("admins", "login=?", (login,))
+            admin = self._find_admin(login, now)
         except sqlite3.Error as exc:
             QtWidgets.QMessageBox.critical(self, "Ошибка БД", str(exc))
             return
-        if not admin or admin.get("password") != password:
+        stored = admin.get("password") if admin else None
+        if not verify_password(password, stored or _DUMMY_HASH) or not admin:
+            self._last_failure_ts = now
             self.error_label.setText("Неверный логин или пароль")
             return
+        if needs_rehash(admin["password"]):
+            # Older hash format or cost: upgrade while the plain password is at hand.
+            try:
+                db.update("admins", {"password": hash_password(password)}, "login=?", (login,))
+            except sqlite3.Error:
+                pass
+            self._admin_cache.pop(login, None)
         self.error_label.clear()
-        self.authenticated.emit(admin)
+        self.authenticated.emit(dict(admin))
+
+    def _find_admin(self, login: str, now: float) -> Optional[db.Record]:
+        cached = self._admin_cache.get(login)
+        if cached and now - cached[0] < _ADMIN_CACHE_TTL:
+            return cached[1]
+        admin = db.select_one("admins", "login=?", (login,))
+        # Misses are not cached: an admin created while this window is open can log in right away.
+        if admin is not None:
+            self._admin_cache[login] = (now, admin)
+        return admin
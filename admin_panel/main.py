@@ -10,12 +10,14 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 if str(BASE_DIR) not in sys.path:
     sys.path.insert(0, str(BASE_DIR))
 
+from admin_panel import db
 from admin_panel.login_window import LoginWindow
 from admin_panel.main_window import MainWindow
 
 
 def main() -> None:
     app = QtWidgets.QApplication(sys.argv)
+    db.init_db()
     login_window = LoginWindow()
     main_window: Optional[MainWindow] = None
 
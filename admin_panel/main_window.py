@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple
 
 from PyQt5 import QtCore, QtWidgets
 
@@ -11,6 +11,8 @@ from .feedback_page import FeedbackPage
 from .questions_page import QuestionsPage
 from .restaurants_page import RestaurantsPage
 
+_STRUCTURE_PAGE_INDEX = 2
+
 
 class MainWindow(QtWidgets.QMainWindow):
     def __init__(self) -> None:
@@ -18,6 +20,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.setWindowTitle("FindFood Admin")
         self.resize(1320, 860)
         self._nav_buttons: List[QtWidgets.QPushButton] = []
+        self._page_factories: List[Callable[[], QtWidgets.QWidget]] = []
+        self._pages: List[Optional[QtWidgets.QWidget]] = []
         self._setup_ui()
 
     def _setup_ui(self) -> None:
@@ -32,30 +36,23 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.stack = QtWidgets.QStackedWidget()
 
-        self.questions_page = QuestionsPage()
-        self.dialogs_page = DialogsPage()
-        self.dialog_structure_page = DialogStructurePage()
-        self.ai_dialogs_page = AIDialogsPage()
-        self.feedback_page = FeedbackPage()
-        self.restaurants_page = RestaurantsPage()
-
-        self.questions_page.data_changed.connect(self.dialog_structure_page.reload_data)
-        self.dialogs_page.open_structure_requested.connect(self._open_dialog_structure)
-
-        pages: List[Tuple[str, QtWidgets.QWidget]] = [
-            ("Вопросы", self.questions_page),
-            ("Диалоги", self.dialogs_page),
-            ("Структура диалога", self.dialog_structure_page),
-            ("AI История", self.ai_dialogs_page),
-            ("AI Feedback", self.feedback_page),
-            ("Рестораны", self.restaurants_page),
+        pages: List[Tuple[str, Callable[[], QtWidgets.QWidget]]] = [
+            ("Вопросы", self._create_questions_page),
+            ("Диалоги", self._create_dialogs_page),
+            ("Структура диалога", DialogStructurePage),
+            ("AI История", AIDialogsPage),
+            ("AI Feedback", FeedbackPage),
+            ("Рестораны", RestaurantsPage),
         ]
 
-        for idx, (title, widget) in enumerate(pages):
-            self.stack.addWidget(widget)
+        for idx, (title, factory) in enumerate(pages):
+            self._page_factories.append(factory)
+            self._pages.append(None)
+            self.stack.addWidget(QtWidgets.QWidget())
             btn = QtWidgets.QPushButton(title)
             btn.setCheckable(True)
-            btn.clicked.connect(lambda _, i=idx: self._switch_page(i))
+            btn.setProperty("pageIndex", idx)
+            btn.clicked.connect(self._on_nav_clicked)
             sidebar_layout.addWidget(btn)
             self._nav_buttons.append(btn)
 
@@ -66,18 +63,46 @@ class MainWindow(QtWidgets.QMainWindow):
         self.setCentralWidget(central)
 
         if self._nav_buttons:
-            self._nav_buttons[0].setChecked(True)
-            self.stack.setCurrentIndex(0)
+            self._switch_page(0)
+
+    def _create_questions_page(self) -> QuestionsPage:
+        page = QuestionsPage()
+        page.data_changed.connect(self._reload_dialog_structure)
+        return page
+
+    def _create_dialogs_page(self) -> DialogsPage:
+        page = DialogsPage()
+        page.open_structure_requested.connect(self._open_dialog_structure)
+        return page
+
+    def _ensure_page(self, index: int) -> QtWidgets.QWidget:
+        page = self._pages[index]
+        if page is None:
+            page = self._page_factories[index]()
+            placeholder = self.stack.widget(index)
+            self.stack.removeWidget(placeholder)
+            placeholder.deleteLater()
+            self.stack.insertWidget(index, page)
+            self._pages[index] = page
+        return page
+
+    def _on_nav_clicked(self) -> None:
+        self._switch_page(self.sender().property("pageIndex"))
 
     def _switch_page(self, index: int) -> None:
-        if index < 0 or index >= self.stack.count():
+        if index < 0 or index >= len(self._pages):
             return
+        self._ensure_page(index)
         self.stack.setCurrentIndex(index)
         for idx, button in enumerate(self._nav_buttons):
             button.setChecked(idx == index)
 
+    def _reload_dialog_structure(self) -> None:
+        page = self._pages[_STRUCTURE_PAGE_INDEX]
+        if page is not None:
+            page.reload_data()
+
     def _open_dialog_structure(self, dialog: dict) -> None:
-        self.dialog_structure_page.load_dialog(dialog)
-        target_index = self.stack.indexOf(self.dialog_structure_page)
-        if target_index != -1:
-            self._switch_page(target_index)
+        page = self._ensure_page(_STRUCTURE_PAGE_INDEX)
+        page.load_dialog(dialog)
+        self._switch_page(_STRUCTURE_PAGE_INDEX)
@@ -11,7 +11,7 @@ from . import db
 class QuestionForm(QtWidgets.QDialog):
     saved = QtCore.pyqtSignal()
 
-    def __init__(self, question: Optional[dict] = None, parent: Optional[QtWidgets.QWidget] = None) -> None:
+    def __init__(self, question: Optional[db.Record] = None, parent: Optional[QtWidgets.QWidget] = None) -> None:
         super().__init__(parent)
         self.question = question
         self.setWindowTitle("Редактирование вопроса" if question else "Добавление вопроса")
@@ -45,7 +45,7 @@ class QuestionForm(QtWidgets.QDialog):
         if question:
             self._fill_form(question)
 
-    def _fill_form(self, question: dict) -> None:
+    def _fill_form(self, question: db.Record) -> None:
         self.question_edit.setPlainText(question.get("question", ""))
         self.type_input.setText(question.get("type", "") or "")
         self.active_checkbox.setChecked(bool(question.get("is_active", 1)))
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
 import sqlite3
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
-from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5 import QtCore, QtWidgets
 
 from . import db
+from .columns import ACTIVE_LABELS, QUESTION_ID, QUESTION_IS_ACTIVE, QUESTION_TEXT, QUESTION_TYPE
+from .db_worker import QueryJob
 from .question_form import QuestionForm
+from .table_models import RowsTableModel
 
 
 class QuestionsPage(QtWidgets.QWidget):
@@ -14,7 +17,14 @@ class QuestionsPage(QtWidgets.QWidget):
 
     def __init__(self, parent: Optional[QtWidgets.QWidget] = None) -> None:
         super().__init__(parent)
-        self._rows: List[dict] = []
+        self._rows: List[db.Record] = []
+        self._generation = 0
+        self._selected_row_cache: Optional[db.Record] = None
+        self._last_query_key: Optional[Tuple[str]] = None
+        self._search_timer = QtCore.QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(150)
+        self._search_timer.timeout.connect(self._search_debounced)
         self._setup_ui()
         self.load_questions()
 
@@ -24,9 +34,10 @@ class QuestionsPage(QtWidgets.QWidget):
         search_layout = QtWidgets.QHBoxLayout()
         self.search_input = QtWidgets.QLineEdit()
         self.search_input.setPlaceholderText("Поиск по вопросу")
-        self.search_input.returnPressed.connect(self.load_questions)
+        self.search_input.textChanged.connect(self._search_timer.start)
+        self.search_input.returnPressed.connect(self._search_now)
         search_btn = QtWidgets.QPushButton("Поиск")
-        search_btn.clicked.connect(self.load_questions)
+        search_btn.clicked.connect(self._search_now)
         search_layout.addWidget(self.search_input)
         search_layout.addWidget(search_btn)
 
@@ -37,9 +48,18 @@ class QuestionsPage(QtWidgets.QWidget):
         self.table.verticalHeader().setVisible(False)
         self.table.horizontalHeader().setStretchLastSection(True)
 
-        self.model = QtGui.QStandardItemModel(0, 4)
-        self.model.setHorizontalHeaderLabels(["ID", "Вопрос", "Тип", "Активный"])
+        self.model = RowsTableModel(
+            ["ID", "Вопрос", "Тип", "Активный"],
+            [
+                lambda row: str(row[QUESTION_ID]),
+                lambda row: row[QUESTION_TEXT] or "",
+                lambda row: row[QUESTION_TYPE] or "",
+                lambda row: ACTIVE_LABELS.get(row[QUESTION_IS_ACTIVE], "Да"),
+            ],
+            self,
+        )
         self.table.setModel(self.model)
+        self.table.selectionModel().selectionChanged.connect(self._sync_selection)
 
         buttons_layout = QtWidgets.QHBoxLayout()
         add_btn = QtWidgets.QPushButton("Добавить")
@@ -58,44 +78,59 @@ class QuestionsPage(QtWidgets.QWidget):
         layout.addWidget(self.table)
         layout.addLayout(buttons_layout)
 
+    def _search_now(self) -> None:
+        self._search_timer.stop()
+        self.load_questions()
+
+    def _search_debounced(self) -> None:
+        # Typing that ends on the already loaded term (e.g. "ab" -> "abc" -> "ab") needs no new query.
+        if (self.search_input.text().strip(),) != self._last_query_key:
+            self.load_questions()
+
     def load_questions(self) -> None:
         term = self.search_input.text().strip()
-        where = None
-        params: List[str] = []
-        if term:
-            where = "question LIKE ?"
-            params = [f"%{term}%"]
-        try:
-            self._rows = db.select_all("qa", where, params, order_by="id DESC")
-        except sqlite3.Error as exc:
-            QtWidgets.QMessageBox.critical(self, "Ошибка загрузки", str(exc))
+        self._last_query_key = (term,)
+        self._generation += 1
+        job = QueryJob(self._generation, db.search_questions, term)
+        job.signals.finished.connect(self._on_rows_loaded)
+        job.signals.failed.connect(self._on_load_failed)
+        self.table.setEnabled(False)
+        QtCore.QThreadPool.globalInstance().start(job)
+
+    def _on_rows_loaded(self, generation: int, rows: List[db.Record]) -> None:
+        if generation != self._generation:
             return
-
-        self.model.setRowCount(0)
-        for row in self._rows:
-            items = [
-                QtGui.QStandardItem(str(row.get("id"))),
-                QtGui.QStandardItem(row.get("question") or ""),
-                QtGui.QStandardItem(row.get("type") or ""),
-                QtGui.QStandardItem("Да" if row.get("is_active", 1) else "Нет"),
-            ]
-            for item in items:
-                item.setEditable(False)
-            self.model.appendRow(items)
-
-    def _get_selected_row(self) -> Optional[dict]:
-        indexes = self.table.selectionModel().selectedRows()
-        if not indexes:
-            return None
-        row_idx = indexes[0].row()
-        if 0 <= row_idx < len(self._rows):
-            return self._rows[row_idx]
-        return None
+        self.table.setEnabled(True)
+        self._selected_row_cache = None
+        self._rows = rows
+        self.table.clearSelection()
+        self.model.update_rows(self._rows)
+
+    def _on_load_failed(self, generation: int, message: str) -> None:
+        if generation != self._generation:
+            return
+        self._last_query_key = None
+        self.table.setEnabled(True)
+        QtWidgets.QMessageBox.critical(self, "Ошибка загрузки", message)
+
+    def _sync_selection(self, selected: QtCore.QItemSelection, deselected: QtCore.QItemSelection) -> None:
+        # The delta alone misses deselect-while-another-stays and extend cases; read the model's current state.
+        self._selected_row_cache = None
+        selected_rows = self.table.selectionModel().selectedRows()
+        if selected_rows:
+            idx = selected_rows[0].row()
+            rows = self._rows
+            if 0 <= idx < len(rows):
+                self._selected_row_cache = rows[idx]
+
+    def _get_selected_row(self) -> Optional[db.Record]:
+        return self._selected_row_cache
 
     def _open_create(self) -> None:
         dialog = QuestionForm(parent=self)
         dialog.saved.connect(self._handle_data_updated)
-        dialog.exec_()
+        dialog.finished.connect(dialog.deleteLater)
+        dialog.open()
 
     def _open_edit(self) -> None:
         selected = self._get_selected_row()
@@ -104,7 +139,8 @@ class QuestionsPage(QtWidgets.QWidget):
             return
         dialog = QuestionForm(question=selected, parent=self)
         dialog.saved.connect(self._handle_data_updated)
-        dialog.exec_()
+        dialog.finished.connect(dialog.deleteLater)
+        dialog.open()
 
     def _delete_question(self) -> None:
         selected = self._get_selected_row()
@@ -120,7 +156,7 @@ class QuestionsPage(QtWidgets.QWidget):
         if confirm != QtWidgets.QMessageBox.Yes:
             return
         try:
-            db.update("qa", {"is_active": 0}, "id=?", (selected["id"],))
+            db.update("qa", {"is_active": 0}, "id=?", (selected[QUESTION_ID],))
         except sqlite3.Error as exc:
             QtWidgets.QMessageBox.critical(self, "Ошибка БД", str(exc))
             return
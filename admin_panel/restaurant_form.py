@@ -11,7 +11,7 @@ from . import db
 class RestaurantForm(QtWidgets.QDialog):
     saved = QtCore.pyqtSignal()
 
-    def __init__(self, restaurant: Optional[dict] = None, parent: Optional[QtWidgets.QWidget] = None) -> None:
+    def __init__(self, restaurant: Optional[db.Record] = None, parent: Optional[QtWidgets.QWidget] = None) -> None:
         super().__init__(parent)
         self.restaurant = restaurant
         self.setWindowTitle("Редактирование ресторана" if restaurant else "Добавить ресторан")
@@ -49,7 +49,7 @@ class RestaurantForm(QtWidgets.QDialog):
         if restaurant:
             self._fill_form(restaurant)
 
-    def _fill_form(self, restaurant: dict) -> None:
+    def _fill_form(self, restaurant: db.Record) -> None:
         self.name_input.setText(restaurant.get("name", ""))
         self.city_input.setText(restaurant.get("city", ""))
         self.cuisine_input.setText(restaurant.get("cuisine", "") or "")
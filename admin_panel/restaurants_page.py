@@ -1,18 +1,23 @@
 from __future__ import annotations
 
 import sqlite3
-from typing import List, Optional
+from typing import Optional
 
-from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5 import QtCore, QtWidgets
 
 from . import db
+from .columns import RESTAURANT_CITY, RESTAURANT_CUISINE, RESTAURANT_ID, RESTAURANT_NAME, RESTAURANT_RATING
 from .restaurant_form import RestaurantForm
+from .table_models import RowsTableModel
 
 
 class RestaurantsPage(QtWidgets.QWidget):
     def __init__(self, parent: Optional[QtWidgets.QWidget] = None) -> None:
         super().__init__(parent)
-        self._rows: List[dict] = []
+        self._search_timer = QtCore.QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(250)
+        self._search_timer.timeout.connect(self.load_restaurants)
         self._setup_ui()
         self.load_restaurants()
 
@@ -22,9 +27,10 @@ class RestaurantsPage(QtWidgets.QWidget):
         search_layout = QtWidgets.QHBoxLayout()
         self.search_input = QtWidgets.QLineEdit()
         self.search_input.setPlaceholderText("Поиск по названию или городу")
-        self.search_input.returnPressed.connect(self.load_restaurants)
+        self.search_input.textChanged.connect(self._search_timer.start)
+        self.search_input.returnPressed.connect(self._search_now)
         search_btn = QtWidgets.QPushButton("Поиск")
-        search_btn.clicked.connect(self.load_restaurants)
+        search_btn.clicked.connect(self._search_now)
         search_layout.addWidget(self.search_input)
         search_layout.addWidget(search_btn)
 
@@ -34,8 +40,17 @@ class RestaurantsPage(QtWidgets.QWidget):
         self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.table.verticalHeader().setVisible(False)
         self.table.horizontalHeader().setStretchLastSection(True)
-        self.model = QtGui.QStandardItemModel(0, 5)
-        self.model.setHorizontalHeaderLabels(["ID", "Название", "Город", "Кухня", "Рейтинг"])
+        self.model = RowsTableModel(
+            ["ID", "Название", "Город", "Кухня", "Рейтинг"],
+            [
+                lambda row: str(row[RESTAURANT_ID]),
+                lambda row: row[RESTAURANT_NAME] or "",
+                lambda row: row[RESTAURANT_CITY] or "",
+                lambda row: row[RESTAURANT_CUISINE] or "",
+                lambda row: str(row[RESTAURANT_RATING]) if row[RESTAURANT_RATING] is not None else "",
+            ],
+            self,
+        )
         self.table.setModel(self.model)
 
         buttons_layout = QtWidgets.QHBoxLayout()
@@ -55,54 +70,53 @@ class RestaurantsPage(QtWidgets.QWidget):
         layout.addWidget(self.table)
         layout.addLayout(buttons_layout)
 
+    def _search_now(self) -> None:
+        self._search_timer.stop()
+        self.load_restaurants()
+
     def load_restaurants(self) -> None:
         term = self.search_input.text().strip()
-        where = None
-        params: List[str] = []
-        if term:
-            where = "name LIKE ? OR city LIKE ?"
-            like = f"%{term}%"
-            params = [like, like]
         try:
-            self._rows = db.select_all("restaurants", where, params, order_by="id DESC", limit=500)
+            rows = db.search_restaurants(term)
         except sqlite3.Error as exc:
             QtWidgets.QMessageBox.critical(self, "Ошибка загрузки", str(exc))
             return
-        self.model.setRowCount(0)
-        for row in self._rows:
-            items = [
-                QtGui.QStandardItem(str(row.get("id"))),
-                QtGui.QStandardItem(row.get("name") or ""),
-                QtGui.QStandardItem(row.get("city") or ""),
-                QtGui.QStandardItem(row.get("cuisine") or ""),
-                QtGui.QStandardItem(str(row.get("rating")) if row.get("rating") is not None else ""),
-            ]
-            for item in items:
-                item.setEditable(False)
-            self.model.appendRow(items)
-
-    def _selected_row(self) -> Optional[dict]:
+        self.table.clearSelection()
+        self.model.update_rows(rows)
+
+    def _selected_row(self) -> Optional[db.Record]:
         indexes = self.table.selectionModel().selectedRows()
         if not indexes:
             return None
         idx = indexes[0].row()
-        if 0 <= idx < len(self._rows):
-            return self._rows[idx]
+        rows = self.model.rows()
+        if 0 <= idx < len(rows):
+            return rows[idx]
         return None
 
     def _open_create(self) -> None:
         dialog = RestaurantForm(parent=self)
         dialog.saved.connect(self.load_restaurants)
-        dialog.exec_()
+        dialog.finished.connect(dialog.deleteLater)
+        dialog.open()
 
     def _open_edit(self) -> None:
-        record = self._selected_row()
-        if not record:
+        selected = self._selected_row()
+        if not selected:
             QtWidgets.QMessageBox.information(self, "Внимание", "Выберите запись")
             return
+        try:
+            record = db.select_one("restaurants", "id=?", (selected[RESTAURANT_ID],))
+        except sqlite3.Error as exc:
+            QtWidgets.QMessageBox.critical(self, "Ошибка загрузки", str(exc))
+            return
+        if not record:
+            self.load_restaurants()
+            return
         dialog = RestaurantForm(record, parent=self)
         dialog.saved.connect(self.load_restaurants)
-        dialog.exec_()
+        dialog.finished.connect(dialog.deleteLater)
+        dialog.open()
 
     def _delete(self) -> None:
         record = self._selected_row()
@@ -112,13 +126,13 @@ class RestaurantsPage(QtWidgets.QWidget):
         confirm = QtWidgets.QMessageBox.question(
             self,
             "Удаление",
-            f"Удалить ресторан {record.get('name')}?",
+            f"Удалить ресторан {record[RESTAURANT_NAME]}?",
             QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
         )
         if confirm != QtWidgets.QMessageBox.Yes:
             return
         try:
-            db.delete("restaurants", "id=?", (record["id"],))
+            db.delete("restaurants", "id=?", (record[RESTAURANT_ID],))
         except sqlite3.Error as exc:
             QtWidgets.QMessageBox.critical(self, "Ошибка БД", str(exc))
             return
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import secrets
+from typing import Optional
+
+_SCHEME = "pbkdf2_sha256"
+_ITERATIONS = 260_000
+
+
+def _pbkdf2(password: str, salt: str, iterations: int) -> str:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt.encode("utf-8"), iterations).hex()
+
+
+def hash_password(password: str, salt: Optional[str] = None, iterations: int = _ITERATIONS) -> str:
+    salt = salt or secrets.token_hex(16)
+    return f"{_SCHEME}${iterations}${salt}${_pbkdf2(password, salt, iterations)}"
+
+
+def is_hashed(stored: str) -> bool:
+    parts = stored.split("$")
+    return len(parts) == 4 and parts[0] == _SCHEME and parts[1].isdigit() and all(parts[2:])
+
+
+def needs_rehash(stored: str) -> bool:
+    return not stored.startswith(f"{_SCHEME}${_ITERATIONS}$")
+
+
+def verify_password(password: str, stored: Optional[str]) -> bool:
+    if not stored or not is_hashed(stored):
+        return False
+    _, iterations, salt, digest = stored.split("$")
+    return hmac.compare_digest(_pbkdf2(password, salt, int(iterations)), digest)
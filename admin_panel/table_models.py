@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from PyQt5 import QtCore
+
+from .db_worker import QueryJob
+
+# Views query data() for every paint role of every visible cell; only DisplayRole carries data,
+# so the role check uses a plain int instead of an enum attribute lookup.
+_DISPLAY_ROLE = int(QtCore.Qt.DisplayRole)
+
+
+class RowsTableModel(QtCore.QAbstractTableModel):
+    def __init__(
+        self,
+        headers: Sequence[str],
+        formatters: Sequence[Callable[[Any], str]],
+        parent: Optional[QtCore.QObject] = None,
+    ) -> None:
+        super().__init__(parent)
+        self._headers = list(headers)
+        self._formatters = list(formatters)
+        self._rows: List[Any] = []
+        self._display: List[Tuple[str, ...]] = []
+
+    def _render(self, rows: Sequence[Any]) -> List[Tuple[str, ...]]:
+        formatters = self._formatters
+        return [tuple(fmt(row) for fmt in formatters) for row in rows]
+
+    def rows(self) -> List[Any]:
+        return self._rows
+
+    def set_rows(self, rows: List[Any]) -> None:
+        self.beginResetModel()
+        self._rows = rows
+        self._display = self._render(rows)
+        self.endResetModel()
+
+    def update_rows(self, rows: List[Any]) -> None:
+        if not rows or len(rows) != len(self._rows):
+            self.set_rows(rows)
+            return
+        display = self._render(rows)
+        changed = [idx for idx, (old, new) in enumerate(zip(self._display, display)) if old != new]
+        self._rows = rows
+        self._display = display
+        if not changed:
+            return
+        self.dataChanged.emit(
+            self.index(changed[0], 0),
+            self.index(changed[-1], len(self._headers) - 1),
+            [QtCore.Qt.DisplayRole],
+        )
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._headers)
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole) -> Any:
+        if role != _DISPLAY_ROLE or not index.isValid():
+            return None
+        return self._display[index.row()][index.column()]
+
+    def headerData(self, section: int, orientation: QtCore.Qt.Orientation, role: int = QtCore.Qt.DisplayRole) -> Any:
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self._headers[section]
+        return super().headerData(section, orientation, role)
+
+
+class PagedRowsTableModel(RowsTableModel):
+    fetch_failed = QtCore.pyqtSignal(str)
+
+    def __init__(
+        self,
+        headers: Sequence[str],
+        formatters: Sequence[Callable[[Any], str]],
+        fetch_page: Callable[[int, int], List[Any]],
+        page_size: int = 50,
+        parent: Optional[QtCore.QObject] = None,
+    ) -> None:
+        super().__init__(headers, formatters, parent)
+        self._fetch_page = fetch_page
+        self._page_size = page_size
+        self._has_more = False
+        self._fetching = False
+        self._page_job_id = 0
+
+    def set_first_page(self, rows: List[Any]) -> None:
+        # A page still in flight belongs to the previous result set; bumping the id drops it on arrival.
+        self._page_job_id += 1
+        self._fetching = False
+        self._has_more = len(rows) == self._page_size
+        self.update_rows(list(rows))
+
+    def canFetchMore(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> bool:
+        return not parent.isValid() and self._has_more and not self._fetching
+
+    def fetchMore(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> None:
+        if parent.isValid() or not self._has_more or self._fetching:
+            return
+        self._fetching = True
+        job = QueryJob(self._page_job_id, self._fetch_page, len(self._rows), self._page_size)
+        job.signals.finished.connect(self._on_page_loaded)
+        job.signals.failed.connect(self._on_page_failed)
+        QtCore.QThreadPool.globalInstance().start(job)
+
+    def _on_page_failed(self, job_id: int, message: str) -> None:
+        if job_id != self._page_job_id:
+            return
+        self._fetching = False
+        self._has_more = False
+        self.fetch_failed.emit(message)
+
+    def _on_page_loaded(self, job_id: int, rows: List[Any]) -> None:
+        if job_id != self._page_job_id:
+            return
+        self._fetching = False
+        self._has_more = len(rows) == self._page_size
+        if not rows:
+            return
+        start = len(self._rows)
+        self.beginInsertRows(QtCore.QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self._display.extend(self._render(rows))
+        self.endInsertRows()
+
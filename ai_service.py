@@ -5,8 +5,10 @@ utility helpers to build context-rich prompts for the bot.
 """
 
 import asyncio
+import hashlib
 import logging
 import re
+from collections import OrderedDict
 from typing import Optional
 
 import google.generativeai as genai
@@ -16,8 +18,24 @@ log = logging.getLogger("FindFoodAI")
 
 _model: Optional[genai.GenerativeModel] = None
 
+# Ограничиваем число одновременных запросов к Gemini, чтобы не упираться в rate limit.
+_GEMINI_CONCURRENCY = 16
+_gemini_semaphore: Optional[asyncio.Semaphore] = None
 
-_MARKDOWN_PATTERN = re.compile(r"[*_`#>~]+")
+_AI_CACHE_MAXSIZE = 512
+_AI_CACHE: "OrderedDict[str, str]" = OrderedDict()
+
+
+_MARKDOWN_CHARS = "*_`#>~"
+# str.translate удаляет разметку за один проход на уровне C, без движка регулярок.
+_MARKDOWN_TABLE = str.maketrans("", "", _MARKDOWN_CHARS)
+# Для clean_ai_text заодно превращаем \r в \n: лишние пустые строки потом схлопнутся.
+_AI_TEXT_TABLE = str.maketrans({"\r": "\n", **{char: None for char in _MARKDOWN_CHARS}})
+_BULLET_PATTERN = re.compile(r"^[^\S\n]*(?:[-•*]|\d+[\.)])[^\S\n]*", re.MULTILINE)
+_SPACE_BEFORE_NEWLINE_PATTERN = re.compile(r"\s+\n")
+_SENTENCE_BREAK_PATTERN = re.compile(r"\.(\s*)(?=[А-ЯA-Z])")
+_EXTRA_NEWLINES_PATTERN = re.compile(r"\n{3,}")
+_TRAILING_SPACES_PATTERN = re.compile(r"[ \t]+$", re.MULTILINE)
 
 
 _DIRECT_FORMAT_INSTRUCTIONS = (
@@ -49,64 +67,88 @@ def init_ai_service(api_key: Optional[str], model_name: str) -> None:
         log.warning("Не удалось инициализировать Gemini (%s)", exc)
 
 
+async def warmup_ai() -> None:
+    """Warm the async Gemini client on the bot's event loop."""
+
+    if not _model:
+        return
+    try:
+        # generate_content_async ходит через async-клиент, который создаётся внутри event loop;
+        # count_tokens_async собирает тот же клиент и соединение, не тратя квоту генерации.
+        await _model.count_tokens_async("ping")
+    except Exception as exc:  # pragma: no cover - прогрев не обязателен
+        log.debug("Прогрев Gemini не удался (%s)", exc)
+
+
 def is_ai_available() -> bool:
     return _model is not None
 
 
+def _response_text(response) -> str:
+    direct_text = getattr(response, "text", None)
+    if direct_text:
+        return direct_text.strip()
+
+    candidates = getattr(response, "candidates", None) or []
+    for candidate in candidates:
+        content = getattr(candidate, "content", None)
+        parts = getattr(content, "parts", []) if content else []
+        texts = [getattr(part, "text", "") for part in parts if getattr(part, "text", None)]
+        combined = "\n".join(chunk.strip() for chunk in texts if chunk)
+        if combined:
+            return combined.strip()
+    return ""
+
+
 async def ask_ai(prompt: str, *, mode: str = "default") -> str:
     if not _model:
         raise RuntimeError("Gemini API не настроен.")
 
-    loop = asyncio.get_running_loop()
-
-    def _call_model() -> str:
-        response = _model.generate_content(prompt)
-        direct_text = getattr(response, "text", None)
-        if direct_text:
-            return direct_text.strip()
-
-        candidates = getattr(response, "candidates", None) or []
-        for candidate in candidates:
-            content = getattr(candidate, "content", None)
-            parts = getattr(content, "parts", []) if content else []
-            texts = [getattr(part, "text", "") for part in parts if getattr(part, "text", None)]
-            combined = "\n".join(chunk.strip() for chunk in texts if chunk)
-            if combined:
-                return combined.strip()
-        return ""
-
-    raw_text = await loop.run_in_executor(None, _call_model)
+    cache_key = hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).hexdigest() + mode
+    cached = _AI_CACHE.get(cache_key)
+    if cached is not None:
+        _AI_CACHE.move_to_end(cache_key)
+        return cached
+
+    global _gemini_semaphore
+    if _gemini_semaphore is None:
+        _gemini_semaphore = asyncio.Semaphore(_GEMINI_CONCURRENCY)
+    async with _gemini_semaphore:
+        response = await _model.generate_content_async(prompt)
+    raw_text = _response_text(response)
     if mode == "structured":
-        return clean_structured_text(raw_text)
-    if mode == "raw":
-        return (raw_text or "").strip()
-    return clean_ai_text(raw_text)
+        result = clean_structured_text(raw_text)
+    elif mode == "raw":
+        result = (raw_text or "").strip()
+    else:
+        result = clean_ai_text(raw_text)
+    if result:
+        _AI_CACHE[cache_key] = result
+        if len(_AI_CACHE) > _AI_CACHE_MAXSIZE:
+            _AI_CACHE.popitem(last=False)
+    return result
 
 
 def clean_ai_text(text: Optional[str]) -> str:
     if not text:
         return ""
 
-    cleaned = _MARKDOWN_PATTERN.sub("", text)
-    bullet_pattern = re.compile(r"^\s*(?:[-•*]|\d+[\.)])\s*")
-    lines = []
-    for line in cleaned.splitlines():
-        stripped = bullet_pattern.sub("", line).rstrip()
-        lines.append(stripped)
-    compact = "\n".join(lines)
-    compact = re.sub(r"\n{3,}", "\n\n", compact)
-    compact = re.sub(r"\s+\n", "\n", compact)
-    compact = re.sub(r"\.(\s*)(?=[А-ЯA-Z])", ".\n\n", compact)
-    compact = re.sub(r"\n{3,}", "\n\n", compact)
+    cleaned = text.translate(_AI_TEXT_TABLE)
+    # Маркеры списков снимаем одним проходом; хвостовые пробелы и лишние пустые строки
+    # схлопывает _SPACE_BEFORE_NEWLINE_PATTERN.
+    compact = _BULLET_PATTERN.sub("", cleaned)
+    compact = _SPACE_BEFORE_NEWLINE_PATTERN.sub("\n", compact)
+    compact = _SENTENCE_BREAK_PATTERN.sub(".\n\n", compact)
+    compact = _EXTRA_NEWLINES_PATTERN.sub("\n\n", compact)
     return compact.strip()
 
 
 def clean_structured_text(text: Optional[str]) -> str:
     if not text:
         return ""
-    cleaned = _MARKDOWN_PATTERN.sub("", text)
-    cleaned = re.sub(r"[ \t]+$", "", cleaned, flags=re.MULTILINE)
-    cleaned = re.sub(r"\n{3,}", "\n\n", cleaned)
+    cleaned = text.translate(_MARKDOWN_TABLE)
+    cleaned = _TRAILING_SPACES_PATTERN.sub("", cleaned)
+    cleaned = _EXTRA_NEWLINES_PATTERN.sub("\n\n", cleaned)
     return cleaned.strip()
 
 
@@ -123,6 +165,44 @@ MODE_TITLES = {
 }
 
 
+# Неизменная часть промптов собрана заранее; на вызове подставляются только переменные поля.
+_RECIPE_TEMPLATE = (
+    "{persona}. Пользователь из {city} ищет рецепт {taste}.{context}"
+    " Ответь строго тремя абзацами без Markdown и маркеров:"
+    "\n1) Первая строка — эмодзи и название блюда."
+    "\n2) Вторая строка — короткий список ингредиентов через запятую."
+    "\n3) Третья строка — 3–5 шагов приготовления в одном абзаце с номерами 1️⃣ 2️⃣ 3️⃣."
+    "\nНе добавляй лишних пояснений. Если запрос не про еду, мягко предложи выбрать блюдо, кафе или рецепт."
+)
+_RESTAURANT_TEMPLATE = (
+    "{persona}. Пользователь из {city} ищет место, где можно поесть {taste}.{context}"
+    " Ответь строго тремя абзацами без Markdown и маркеров:"
+    "\n1) Первая строка — название заведения и короткая атмосфера."
+    "\n2) Вторая строка — блюдо или повод, ради которого стоит зайти."
+    "\n3) Третья строка — совет по визиту или лучший момент для посещения."
+    "\nНе добавляй лишних рекомендаций. Если запрос не про еду, мягко предложи выбрать направление."
+)
+_NEUTRAL_TEMPLATE = (
+    "{persona}. Пользователь не знает, чего хочет, но находится в {city}.{context}"
+    " Предложи один нейтральный вариант блюда или места. Ответь тремя абзацами:"
+    "\n1) Первая строка — название с дружественным тоном."
+    "\n2) Вторая строка — что это за вариант и из чего он состоит или чем привлекает."
+    "\n3) Третья строка — короткий совет, как насладиться выбором."
+    "\nНе упоминай категорию и не используй Markdown. Если вопрос не про еду, вежливо направь к выбору блюда или места."
+)
+_RECOMMENDATION_TEMPLATES = {
+    "recipe": _RECIPE_TEMPLATE,
+    "restaurant": _RESTAURANT_TEMPLATE,
+}
+_DIRECT_TEMPLATE = _DIRECT_FORMAT_INSTRUCTIONS + "\n\nЗапрос: {query}"
+_DIRECT_REFINEMENT_TEMPLATE = (
+    _DIRECT_FORMAT_INSTRUCTIONS
+    + "\n\nЗапрос: {query}\n"
+    "Предыдущий ответ не подошёл пользователю:\n{previous}\n"
+    "Сформируй новый вариант, сохрани формат и сделай его более точным."
+)
+
+
 def build_recommendation_prompt(
     *,
     city: Optional[str],
@@ -142,50 +222,13 @@ def build_recommendation_prompt(
 
     base_persona = persona or "Ты — дружелюбный бот FindFood"
 
-    if mode == "recipe":
-        return (
-            f"{base_persona}. Пользователь из {city_label} ищет рецепт {taste_label}.{context_line}"
-            " Ответь строго тремя абзацами без Markdown и маркеров:"
-            "\n1) Первая строка — эмодзи и название блюда."
-            "\n2) Вторая строка — короткий список ингредиентов через запятую."
-            "\n3) Третья строка — 3–5 шагов приготовления в одном абзаце с номерами 1️⃣ 2️⃣ 3️⃣." 
-            "\nНе добавляй лишних пояснений. Если запрос не про еду, мягко предложи выбрать блюдо, кафе или рецепт."
-        )
-
-    if mode == "restaurant":
-        return (
-            f"{base_persona}. Пользователь из {city_label} ищет место, где можно поесть {taste_label}.{context_line}"
-            " Ответь строго тремя абзацами без Markdown и маркеров:"
-            "\n1) Первая строка — название заведения и короткая атмосфера."
-            "\n2) Вторая строка — блюдо или повод, ради которого стоит зайти."
-            "\n3) Третья строка — совет по визиту или лучший момент для посещения." 
-            "\nНе добавляй лишних рекомендаций. Если запрос не про еду, мягко предложи выбрать направление."
-        )
-
-    return (
-        f"{base_persona}. Пользователь не знает, чего хочет, но находится в {city_label}.{context_line}"
-        " Предложи один нейтральный вариант блюда или места. Ответь тремя абзацами:"
-        "\n1) Первая строка — название с дружественным тоном."
-        "\n2) Вторая строка — что это за вариант и из чего он состоит или чем привлекает."
-        "\n3) Третья строка — короткий совет, как насладиться выбором." 
-        "\nНе упоминай категорию и не используй Markdown. Если вопрос не про еду, вежливо направь к выбору блюда или места."
-    )
+    template = _RECOMMENDATION_TEMPLATES.get(mode, _NEUTRAL_TEMPLATE)
+    return template.format(persona=base_persona, city=city_label, taste=taste_label, context=context_line)
 
 
 def build_direct_prompt(question: str) -> str:
-    query = question.strip()
-    return (
-        f"{_DIRECT_FORMAT_INSTRUCTIONS}\n\n"
-        f"Запрос: {query}"
-    )
+    return _DIRECT_TEMPLATE.format(query=question.strip())
 
 
 def build_direct_refinement_prompt(question: str, previous_answer: str) -> str:
-    query = question.strip()
-    prev = previous_answer.strip()
-    return (
-        f"{_DIRECT_FORMAT_INSTRUCTIONS}\n\n"
-        f"Запрос: {query}\n"
-        f"Предыдущий ответ не подошёл пользователю:\n{prev}\n"
-        "Сформируй новый вариант, сохрани формат и сделай его более точным."
-    )
+    return _DIRECT_REFINEMENT_TEMPLATE.format(query=question.strip(), previous=previous_answer.strip())
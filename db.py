@@ -1,296 +1,438 @@
 # db.py — база FindFood 3.1
+import asyncio
+import atexit
+import logging
 import sqlite3
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
-from typing import Optional
+from functools import partial
+from typing import NamedTuple, Optional
+
+log = logging.getLogger(__name__)
 
 DB_PATH = "foodmate.db"
+SCHEMA_VERSION = 5
+_NEW_DB_PAGE_SIZE = 32768
+
+_local = threading.local()
+# Все per-thread соединения, чтобы при выходе прогнать по ним PRAGMA optimize и закрыть.
+_shared_conns: list = []
+_shared_conns_lock = threading.Lock()
+# Все записи из бота идут через один поток: писатель в SQLite всё равно один.
+_WRITE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+# В WAL synchronous=NORMAL не теряет целостность, но снимает fsync с каждого коммита.
+_CONN_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+)
 
 def get_conn():
-    conn = sqlite3.connect(DB_PATH, timeout=15, check_same_thread=False)
+    # Поисковые запросы собираются в несколько форм SQL — держим их подготовленными рядом с upsert'ами.
+    conn = sqlite3.connect(DB_PATH, timeout=15, check_same_thread=False, cached_statements=256)
     conn.row_factory = sqlite3.Row
+    for pragma in _CONN_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def init_db():
-    with closing(get_conn()) as conn, conn:
+def shared_conn() -> sqlite3.Connection:
+    # Одно соединение на поток: не платим за open/прогрев кэша на каждый запрос.
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = get_conn()
+        _local.conn = conn
+        with _shared_conns_lock:
+            _shared_conns.append(conn)
+    return conn
+
+
+def _close_shared_conns():
+    # optimize дообновляет статистику планировщика там, где она устарела, — дёшево при закрытии.
+    with _shared_conns_lock:
+        conns = list(_shared_conns)
+        _shared_conns.clear()
+    for conn in conns:
         try:
-            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA optimize")
+            conn.close()
         except sqlite3.Error:
             pass
-        # Миграция старой таблицы feedback -> ai_feedback
-        legacy_feedback = False
-        try:
-            cols = conn.execute("PRAGMA table_info(feedback)").fetchall()
-            column_names = {col[1] for col in cols}
-            legacy_feedback = bool(column_names) and "feedback_type" not in column_names and "question" in column_names
-        except sqlite3.OperationalError:
-            legacy_feedback = False
-        if legacy_feedback:
-            conn.execute("ALTER TABLE feedback RENAME TO ai_feedback")
-
-        conn.executescript("""
-        CREATE TABLE IF NOT EXISTS users(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_id INTEGER UNIQUE,
-            name TEXT,
-            age INTEGER,
-            city TEXT,
-            locale TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS recipes(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT,
-            ingredients TEXT,
-            steps TEXT,
-            category TEXT,
-            cuisine TEXT,
-            reaction TEXT,
-            tags TEXT,
-            keywords TEXT,
-            likes INTEGER DEFAULT 0,
-            popularity INTEGER DEFAULT 1,
-            title_en TEXT,
-            ingredients_en TEXT,
-            steps_en TEXT,
-            photo_url TEXT
-        );
-
-        CREATE TABLE IF NOT EXISTS restaurants(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            city TEXT,
-            address TEXT,
-            cuisine TEXT,
-            rating REAL DEFAULT 4.5,
-            contact TEXT,
-            tags TEXT,
-            reaction TEXT,
-            keywords TEXT,
-            category TEXT,
-            description TEXT,
-            photo_url TEXT,
-            latitude REAL,
-            longitude REAL
-        );
-
-        CREATE TABLE IF NOT EXISTS favorites(
-            chat_id INTEGER,
-            recipe_id INTEGER,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS favorite_places(
-            chat_id INTEGER,
-            place_id TEXT,
-            name TEXT,
-            address TEXT,
-            photo_url TEXT,
-            PRIMARY KEY(chat_id, place_id)
-        );
-
-        CREATE TABLE IF NOT EXISTS user_history(
-            chat_id INTEGER,
-            item_id INTEGER,
-            item_type TEXT,
-            category TEXT,
-            liked INTEGER DEFAULT 0,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS user_tastes(
-            chat_id INTEGER,
-            category TEXT,
-            likes INTEGER DEFAULT 0,
-            dislikes INTEGER DEFAULT 0,
-            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(chat_id, category)
-        );
-
-        CREATE TABLE IF NOT EXISTS user_preferences(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER UNIQUE,
-            last_mode TEXT,
-            last_category TEXT,
-            last_query TEXT,
-            liked_count INTEGER DEFAULT 0,
-            disliked_count INTEGER DEFAULT 0,
-            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS synonyms(
-            word TEXT PRIMARY KEY,
-            alt_words TEXT
-        );
-
-        CREATE TABLE IF NOT EXISTS qa(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question TEXT UNIQUE,
-            answer TEXT,
-            image TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS ai_feedback(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question TEXT,
-            answer TEXT,
-            user_id INTEGER,
-            liked INTEGER DEFAULT 0,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS feedback(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            item_id INTEGER,
-            item_type TEXT,
-            feedback_type TEXT CHECK(feedback_type IN ('like', 'dislike', 'next')),
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS ai_logs(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            question TEXT,
-            answer TEXT,
-            status TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS user_state(
-            user_id INTEGER PRIMARY KEY,
-            category TEXT,
-            mode TEXT,
-            city TEXT,
-            last_action TEXT,
-            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-        """)
-
-        # Мягкие миграции под существующие данные
-        for ddl in (
-            "ALTER TABLE users ADD COLUMN age INTEGER",
-            "ALTER TABLE users ADD COLUMN locale TEXT",
-            "ALTER TABLE recipes ADD COLUMN likes INTEGER DEFAULT 0",
-            "ALTER TABLE recipes ADD COLUMN cuisine TEXT",
-            "ALTER TABLE recipes ADD COLUMN reaction TEXT",
-            "ALTER TABLE recipes ADD COLUMN tags TEXT",
-            "ALTER TABLE recipes ADD COLUMN keywords TEXT",
-            "ALTER TABLE recipes ADD COLUMN popularity INTEGER DEFAULT 1",
-            "ALTER TABLE recipes ADD COLUMN title_en TEXT",
-            "ALTER TABLE recipes ADD COLUMN ingredients_en TEXT",
-            "ALTER TABLE recipes ADD COLUMN steps_en TEXT",
-            "ALTER TABLE recipes ADD COLUMN photo_url TEXT",
-            "ALTER TABLE favorites ADD COLUMN place_id TEXT",
-            "ALTER TABLE favorites ADD COLUMN name TEXT",
-            "ALTER TABLE favorites ADD COLUMN address TEXT",
-            "ALTER TABLE favorites ADD COLUMN photo_url TEXT",
-            "ALTER TABLE restaurants ADD COLUMN contact TEXT",
-            "ALTER TABLE restaurants ADD COLUMN reaction TEXT",
-            "ALTER TABLE restaurants ADD COLUMN keywords TEXT",
-            "ALTER TABLE restaurants ADD COLUMN category TEXT",
-            "ALTER TABLE restaurants ADD COLUMN description TEXT",
-            "ALTER TABLE restaurants ADD COLUMN photo_url TEXT",
-            "ALTER TABLE restaurants ADD COLUMN latitude REAL",
-            "ALTER TABLE restaurants ADD COLUMN longitude REAL",
-            "ALTER TABLE user_history ADD COLUMN item_id INTEGER",
-            "ALTER TABLE user_history ADD COLUMN item_type TEXT",
-            "ALTER TABLE user_history ADD COLUMN liked INTEGER DEFAULT 0",
-            "ALTER TABLE user_state ADD COLUMN city TEXT"
-        ):
-            try:
-                conn.execute(ddl)
-            except sqlite3.OperationalError:
-                pass
-
-        # Индексы могут ссылаться на добавленные позже колонки — создаём их после миграций.
-        for ddl in (
-            "CREATE INDEX IF NOT EXISTS idx_recipes_tags ON recipes(tags)",
-            "CREATE INDEX IF NOT EXISTS idx_recipes_keywords ON recipes(keywords)",
-            "CREATE INDEX IF NOT EXISTS idx_recipes_category ON recipes(category)",
-            "CREATE INDEX IF NOT EXISTS idx_restaurants_city ON restaurants(city)",
-            "CREATE INDEX IF NOT EXISTS idx_restaurants_category ON restaurants(category)",
-            "CREATE INDEX IF NOT EXISTS idx_restaurants_tags ON restaurants(tags)",
-            "CREATE INDEX IF NOT EXISTS idx_restaurants_keywords ON restaurants(keywords)",
-            "CREATE UNIQUE INDEX IF NOT EXISTS idx_favorites_place ON favorites(chat_id, place_id) WHERE place_id IS NOT NULL",
-            "CREATE INDEX IF NOT EXISTS idx_history_chat ON user_history(chat_id)",
-            "CREATE INDEX IF NOT EXISTS idx_tastes_chat ON user_tastes(chat_id)",
-            "CREATE INDEX IF NOT EXISTS idx_preferences_user ON user_preferences(user_id)",
-            "CREATE INDEX IF NOT EXISTS idx_feedback_user ON feedback(user_id)",
-            "CREATE INDEX IF NOT EXISTS idx_user_state_category ON user_state(category)"
-        ):
-            try:
-                conn.execute(ddl)
-            except sqlite3.OperationalError:
-                pass
+
+
+atexit.register(_close_shared_conns)
+
+# Колонки, появившиеся после первых версий схемы: table -> ((column, type), ...).
+_ADDED_COLUMNS = {
+    "users": (
+        ("age", "INTEGER"),
+        ("locale", "TEXT"),
+    ),
+    "recipes": (
+        ("likes", "INTEGER DEFAULT 0"),
+        ("cuisine", "TEXT"),
+        ("reaction", "TEXT"),
+        ("tags", "TEXT"),
+        ("keywords", "TEXT"),
+        ("popularity", "INTEGER DEFAULT 1"),
+        ("title_en", "TEXT"),
+        ("ingredients_en", "TEXT"),
+        ("steps_en", "TEXT"),
+        ("photo_url", "TEXT"),
+    ),
+    "favorites": (
+        ("place_id", "TEXT"),
+        ("name", "TEXT"),
+        ("address", "TEXT"),
+        ("photo_url", "TEXT"),
+    ),
+    "restaurants": (
+        ("contact", "TEXT"),
+        ("reaction", "TEXT"),
+        ("keywords", "TEXT"),
+        ("category", "TEXT"),
+        ("description", "TEXT"),
+        ("photo_url", "TEXT"),
+        ("latitude", "REAL"),
+        ("longitude", "REAL"),
+    ),
+    "user_history": (
+        ("item_id", "INTEGER"),
+        ("item_type", "TEXT"),
+        ("liked", "INTEGER DEFAULT 0"),
+    ),
+    "user_state": (
+        ("city", "TEXT"),
+    ),
+    "qa": (
+        ("type", "TEXT"),
+        ("is_active", "INTEGER DEFAULT 1"),
+    ),
+}
+
+_INDEX_DDL = (
+    "CREATE INDEX IF NOT EXISTS idx_recipes_tags ON recipes(tags)",
+    "CREATE INDEX IF NOT EXISTS idx_recipes_keywords ON recipes(keywords)",
+    "CREATE INDEX IF NOT EXISTS idx_recipes_category ON recipes(category)",
+    "CREATE INDEX IF NOT EXISTS idx_restaurants_city ON restaurants(city)",
+    "CREATE INDEX IF NOT EXISTS idx_restaurants_category ON restaurants(category)",
+    "CREATE INDEX IF NOT EXISTS idx_restaurants_tags ON restaurants(tags)",
+    "CREATE INDEX IF NOT EXISTS idx_restaurants_keywords ON restaurants(keywords)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_favorites_place ON favorites(chat_id, place_id) WHERE place_id IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_history_chat ON user_history(chat_id)",
+    "CREATE INDEX IF NOT EXISTS idx_tastes_chat ON user_tastes(chat_id)",
+    "CREATE INDEX IF NOT EXISTS idx_preferences_user ON user_preferences(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_feedback_user ON feedback(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_user_state_category ON user_state(category)",
+    # Поиск фильтрует по LOWER(category)=? и сортирует по likes/rating — индексы под ровно эти формы.
+    "CREATE INDEX IF NOT EXISTS idx_recipes_lower_category_likes ON recipes(lower(category), likes DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_restaurants_city_rating ON restaurants(city, rating DESC)",
+    # «Избранное»: последние лайки пользователя и его места по алфавиту без полного скана и сортировки.
+    "CREATE INDEX IF NOT EXISTS idx_history_chat_liked ON user_history(chat_id, item_type, liked, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_favorite_places_chat_name ON favorite_places(chat_id, name)",
+)
+
+# Полнотекстовые индексы для поиска бота: trigram ищет подстроки, как прежние LIKE '%x%'.
+# restaurants_fts занят админкой (name, city, cuisine), поэтому у бота отдельное имя.
+_FTS_TABLES = (
+    ("recipes", "recipes_fts", ("title", "tags", "keywords")),
+    ("restaurants", "restaurants_terms_fts", ("name", "tags", "keywords", "cuisine")),
+)
+
+
+def _create_fts(conn: sqlite3.Connection, table: str, fts: str, columns: tuple) -> None:
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (fts,)).fetchone()
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    conn.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} "
+        f"USING fts5({cols}, content='{table}', content_rowid='id', tokenize='trigram')"
+    )
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values});
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+        INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values});
+    END
+    """)
+    if not exists:
+        # Индекс появился над уже заполненной таблицей — строим его один раз.
+        conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+_TABLES_SQL = """CREATE TABLE IF NOT EXISTS users(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER UNIQUE,
+    name TEXT,
+    age INTEGER,
+    city TEXT,
+    locale TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS recipes(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT,
+    ingredients TEXT,
+    steps TEXT,
+    category TEXT,
+    cuisine TEXT,
+    reaction TEXT,
+    tags TEXT,
+    keywords TEXT,
+    likes INTEGER DEFAULT 0,
+    popularity INTEGER DEFAULT 1,
+    title_en TEXT,
+    ingredients_en TEXT,
+    steps_en TEXT,
+    photo_url TEXT
+);
+
+CREATE TABLE IF NOT EXISTS restaurants(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    city TEXT,
+    address TEXT,
+    cuisine TEXT,
+    rating REAL DEFAULT 4.5,
+    contact TEXT,
+    tags TEXT,
+    reaction TEXT,
+    keywords TEXT,
+    category TEXT,
+    description TEXT,
+    photo_url TEXT,
+    latitude REAL,
+    longitude REAL
+);
+
+CREATE TABLE IF NOT EXISTS favorites(
+    chat_id INTEGER,
+    recipe_id INTEGER,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS favorite_places(
+    chat_id INTEGER,
+    place_id TEXT,
+    name TEXT,
+    address TEXT,
+    photo_url TEXT,
+    PRIMARY KEY(chat_id, place_id)
+);
+
+CREATE TABLE IF NOT EXISTS user_history(
+    chat_id INTEGER,
+    item_id INTEGER,
+    item_type TEXT,
+    category TEXT,
+    liked INTEGER DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS user_tastes(
+    chat_id INTEGER,
+    category TEXT,
+    likes INTEGER DEFAULT 0,
+    dislikes INTEGER DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(chat_id, category)
+);
+
+CREATE TABLE IF NOT EXISTS user_preferences(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER UNIQUE,
+    last_mode TEXT,
+    last_category TEXT,
+    last_query TEXT,
+    liked_count INTEGER DEFAULT 0,
+    disliked_count INTEGER DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS synonyms(
+    word TEXT PRIMARY KEY,
+    alt_words TEXT
+);
+
+CREATE TABLE IF NOT EXISTS qa(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    question TEXT UNIQUE,
+    answer TEXT,
+    image TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ai_feedback(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    question TEXT,
+    answer TEXT,
+    user_id INTEGER,
+    liked INTEGER DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS feedback(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    item_id INTEGER,
+    item_type TEXT,
+    feedback_type TEXT CHECK(feedback_type IN ('like', 'dislike', 'next')),
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ai_logs(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    question TEXT,
+    answer TEXT,
+    status TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS user_state(
+    user_id INTEGER PRIMARY KEY,
+    category TEXT,
+    mode TEXT,
+    city TEXT,
+    last_action TEXT,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+def init_schema(conn: sqlite3.Connection) -> None:
+    # Общая схема бота и админки: админ-панель вызывает её перед своими таблицами.
+    if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+        # Файл только что создан: крупная страница задаётся до первой записи и до WAL,
+        # потом её можно сменить только через VACUUM.
+        conn.execute(f"PRAGMA page_size={_NEW_DB_PAGE_SIZE}")
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.Error:
+        pass
+    # Схема уже актуальна — повторный запуск ничего не пишет и не парсит DDL.
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+
+    # Миграция старой таблицы feedback -> ai_feedback. table_info для отсутствующей таблицы
+    # просто пуст, так что ловить исключение здесь не нужно.
+    column_names = {col[1] for col in conn.execute("PRAGMA table_info(feedback)")}
+    legacy_feedback = bool(column_names) and "feedback_type" not in column_names and "question" in column_names
+    rename = "ALTER TABLE feedback RENAME TO ai_feedback;\n" if legacy_feedback else ""
+
+    # Вся миграция — одна транзакция: скрипт открывает её и не закрывает,
+    # колонки, индексы и версия схемы дописываются в неё же и фиксируются одним коммитом.
+    try:
+        conn.executescript("BEGIN IMMEDIATE;\n" + rename + _TABLES_SQL)
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in columns:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        # Колонки под индексы добавлены выше, так что ошибка DDL здесь — настоящая и откатывает миграцию.
+        for ddl in _INDEX_DDL:
+            conn.execute(ddl)
+        for table, fts, columns in _FTS_TABLES:
+            _create_fts(conn, table, fts, columns)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    # Схема только что поменялась — собираем статистику, чтобы планировщик сразу выбирал новые индексы.
+    conn.execute("ANALYZE")
+
+
+def init_db():
+    with closing(get_conn()) as conn, conn:
+        init_schema(conn)
     print("✅ DB initialized")
 
 
+# Тексты запросов — константы: встроенный кэш prepared statements у sqlite3 привязан
+# к соединению и ключу-строке, поэтому вместе с shared_conn() горячие upsert'ы
+# проходят только bind + step.
+_LOAD_USER_STATE_SQL = "SELECT user_id, category, mode, city, last_action FROM user_state WHERE user_id=?"
+_CLEAR_USER_STATE_SQL = "DELETE FROM user_state WHERE user_id=?"
+_UPSERT_PREFERENCES_SQL = """
+INSERT INTO user_preferences(user_id, last_mode, last_category, last_query)
+VALUES (?,?,?,?)
+ON CONFLICT(user_id) DO UPDATE SET
+    last_mode = COALESCE(excluded.last_mode, user_preferences.last_mode),
+    last_category = COALESCE(excluded.last_category, user_preferences.last_category),
+    last_query = COALESCE(excluded.last_query, user_preferences.last_query),
+    updated_at = CURRENT_TIMESTAMP
+"""
+_INCREMENT_FEEDBACK_SQL = """
+INSERT INTO user_preferences(user_id, liked_count, disliked_count)
+VALUES (?,?,?)
+ON CONFLICT(user_id) DO UPDATE SET
+    liked_count = user_preferences.liked_count + excluded.liked_count,
+    disliked_count = user_preferences.disliked_count + excluded.disliked_count,
+    updated_at = CURRENT_TIMESTAMP
+"""
+_SAVE_USER_STATE_SQL = """
+INSERT INTO user_state(user_id, category, mode, city, last_action)
+VALUES (?,?,?,?,?)
+ON CONFLICT(user_id) DO UPDATE SET
+    category = COALESCE(excluded.category, user_state.category),
+    mode = COALESCE(excluded.mode, user_state.mode),
+    city = COALESCE(excluded.city, user_state.city),
+    last_action = COALESCE(excluded.last_action, user_state.last_action),
+    updated_at = CURRENT_TIMESTAMP
+"""
+_LOG_ITEM_FEEDBACK_SQL = """
+INSERT INTO feedback(user_id, item_id, item_type, feedback_type)
+VALUES (?,?,?,?)
+"""
+
+
 def upsert_user_preferences(user_id: int, *, mode: Optional[str] = None, category: Optional[str] = None, query: Optional[str] = None):
-    with closing(get_conn()) as conn, conn:
-        conn.execute(
-            """
-            INSERT INTO user_preferences(user_id, last_mode, last_category, last_query)
-            VALUES (?,?,?,?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                last_mode = COALESCE(excluded.last_mode, user_preferences.last_mode),
-                last_category = COALESCE(excluded.last_category, user_preferences.last_category),
-                last_query = COALESCE(excluded.last_query, user_preferences.last_query),
-                updated_at = CURRENT_TIMESTAMP
-            """,
-            (user_id, mode, category, query),
-        )
-
-
-def increment_preference_feedback(user_id: int, liked: bool, conn: Optional[sqlite3.Connection] = None, retries: int = 3):
-    payload = (
-        user_id,
-        1 if liked else 0,
-        0 if liked else 1,
-        1 if liked else 0,
-        0 if liked else 1,
-    )
+    conn = shared_conn()
+    with conn:
+        conn.execute(_UPSERT_PREFERENCES_SQL, (user_id, mode, category, query))
 
-    def _execute(target_conn: sqlite3.Connection):
-        target_conn.execute(
-            """
-            INSERT INTO user_preferences(user_id, liked_count, disliked_count)
-            VALUES (?,?,?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                liked_count = user_preferences.liked_count + ?,
-                disliked_count = user_preferences.disliked_count + ?,
-                updated_at = CURRENT_TIMESTAMP
-            """,
-            payload,
-        )
 
+def increment_preference_feedback(user_id: int, liked: bool, conn: Optional[sqlite3.Connection] = None):
+    payload = (user_id, int(liked), int(not liked))
     if conn is not None:
-        _execute(conn)
+        conn.execute(_INCREMENT_FEEDBACK_SQL, payload)
         return
+    # Ожидание занятой базы — на стороне SQLite (timeout=15 в get_conn), без ретраев со sleep.
+    conn = shared_conn()
+    with conn:
+        conn.execute(_INCREMENT_FEEDBACK_SQL, payload)
 
-    for attempt in range(retries):
-        try:
-            with closing(get_conn()) as owned_conn, owned_conn:
-                _execute(owned_conn)
-            return
-        except sqlite3.OperationalError as exc:
-            if "locked" in str(exc).lower() and attempt < retries - 1:
-                time.sleep(0.2 * (attempt + 1))
-                continue
-            raise
-
-
-def load_user_state(user_id: int) -> dict:
-    with closing(get_conn()) as conn:
-        row = conn.execute(
-            "SELECT user_id, category, mode, city, last_action FROM user_state WHERE user_id=?",
-            (user_id,),
-        ).fetchone()
+
+class UserState(NamedTuple):
+    user_id: int
+    category: Optional[str]
+    mode: Optional[str]
+    city: Optional[str]
+    last_action: Optional[str]
+
+
+def load_user_state(user_id: int) -> UserState:
+    # Кортеж собирается прямо из строки курсора, без промежуточных sqlite3.Row и dict.
+    cursor = shared_conn().cursor()
+    cursor.row_factory = None
+    row = cursor.execute(_LOAD_USER_STATE_SQL, (user_id,)).fetchone()
     if not row:
-        return {"user_id": user_id, "category": None, "mode": None, "city": None, "last_action": None}
-    return dict(row)
+        return UserState(user_id, None, None, None, None)
+    return UserState._make(row)
 
 
 def save_user_state(
@@ -301,25 +443,15 @@ def save_user_state(
     city: Optional[str] = None,
     last_action: Optional[str] = None,
 ):
-    with closing(get_conn()) as conn, conn:
-        conn.execute(
-            """
-            INSERT INTO user_state(user_id, category, mode, city, last_action)
-            VALUES (?,?,?,?,?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                category = COALESCE(excluded.category, user_state.category),
-                mode = COALESCE(excluded.mode, user_state.mode),
-                city = COALESCE(excluded.city, user_state.city),
-                last_action = COALESCE(excluded.last_action, user_state.last_action),
-                updated_at = CURRENT_TIMESTAMP
-            """,
-            (user_id, category, mode, city, last_action),
-        )
+    conn = shared_conn()
+    with conn:
+        conn.execute(_SAVE_USER_STATE_SQL, (user_id, category, mode, city, last_action))
 
 
 def clear_user_state(user_id: int):
-    with closing(get_conn()) as conn, conn:
-        conn.execute("DELETE FROM user_state WHERE user_id=?", (user_id,))
+    conn = shared_conn()
+    with conn:
+        conn.execute(_CLEAR_USER_STATE_SQL, (user_id,))
 
 
 def log_item_feedback(
@@ -328,28 +460,139 @@ def log_item_feedback(
     item_type: str,
     feedback_type: str,
     conn: Optional[sqlite3.Connection] = None,
-    retries: int = 3,
 ):
-    def _execute(target_conn: sqlite3.Connection):
-        target_conn.execute(
-            """
-            INSERT INTO feedback(user_id, item_id, item_type, feedback_type)
-            VALUES (?,?,?,?)
-            """,
-            (user_id, item_id, item_type, feedback_type),
-        )
-
+    payload = (user_id, item_id, item_type, feedback_type)
     if conn is not None:
-        _execute(conn)
+        conn.execute(_LOG_ITEM_FEEDBACK_SQL, payload)
         return
+    conn = shared_conn()
+    with conn:
+        conn.execute(_LOG_ITEM_FEEDBACK_SQL, payload)
 
-    for attempt in range(retries):
-        try:
-            with closing(get_conn()) as owned_conn, owned_conn:
-                _execute(owned_conn)
+
+async def run_write(func, *args, **kwargs):
+    # Все записи идут через один поток-писатель: транзакции не спорят за блокировку базы.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_WRITE_EXECUTOR, partial(func, *args, **kwargs))
+
+
+# Отложенная запись user_preferences: бот их только пишет, поэтому обновления копятся в памяти
+# по user_id и раз в полсекунды уходят в базу одной транзакцией через executemany.
+_PREFERENCES_FLUSH_DELAY = 0.5
+_pending_preferences: dict = {}  # user_id -> [mode, category, query]
+_pending_feedback: dict = {}  # user_id -> [liked, disliked]
+_pending_lock = threading.Lock()
+_flush_scheduled = False
+# После неудачного сброса повтор откладывается с удвоением паузы, чтобы запертая база не крутила цикл.
+_FLUSH_RETRY_MAX_DELAY = 30.0
+_flush_failures = 0
+
+
+def queue_user_preferences(
+    user_id: int, *, mode: Optional[str] = None, category: Optional[str] = None, query: Optional[str] = None
+):
+    with _pending_lock:
+        pending = _pending_preferences.setdefault(user_id, [None, None, None])
+        # Та же семантика, что у COALESCE в upsert: побеждает последнее непустое значение.
+        for idx, value in enumerate((mode, category, query)):
+            if value is not None:
+                pending[idx] = value
+    _schedule_preferences_flush()
+
+
+def queue_preference_feedback(user_id: int, liked: bool):
+    with _pending_lock:
+        counts = _pending_feedback.setdefault(user_id, [0, 0])
+        counts[0 if liked else 1] += 1
+    _schedule_preferences_flush()
+
+
+def _schedule_preferences_flush():
+    global _flush_scheduled
+    with _pending_lock:
+        if _flush_scheduled:
             return
-        except sqlite3.OperationalError as exc:
-            if "locked" in str(exc).lower() and attempt < retries - 1:
-                time.sleep(0.2 * (attempt + 1))
-                continue
-            raise
+        _flush_scheduled = True
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Вне event loop (скрипты) откладывать некуда — пишем сразу, но всё равно в потоке-писателе.
+        _WRITE_EXECUTOR.submit(flush_preferences)
+        return
+    loop.call_later(_PREFERENCES_FLUSH_DELAY, _WRITE_EXECUTOR.submit, flush_preferences)
+
+
+def flush_preferences():
+    global _flush_scheduled, _flush_failures
+    with _pending_lock:
+        preferences = [(user_id, *values) for user_id, values in _pending_preferences.items()]
+        feedback = [(user_id, liked, disliked) for user_id, (liked, disliked) in _pending_feedback.items()]
+        _pending_preferences.clear()
+        _pending_feedback.clear()
+        _flush_scheduled = False
+    if not preferences and not feedback:
+        return
+    try:
+        conn = shared_conn()
+        with conn:
+            conn.executemany(_UPSERT_PREFERENCES_SQL, preferences)
+            conn.executemany(_INCREMENT_FEEDBACK_SQL, feedback)
+    except sqlite3.Error as exc:
+        # Например, «database is locked»: возвращаем пачку в буфер и назначаем повторный сброс.
+        _requeue_preferences(preferences, feedback)
+        _flush_failures += 1
+        delay = _schedule_flush_retry()
+        log.warning("Не удалось сохранить user_preferences, повтор через %.1f с: %s", delay, exc)
+        return
+    _flush_failures = 0
+
+
+def _schedule_flush_retry() -> float:
+    global _flush_scheduled
+    delay = min(_PREFERENCES_FLUSH_DELAY * 2 ** min(_flush_failures, 8), _FLUSH_RETRY_MAX_DELAY)
+    with _pending_lock:
+        if _flush_scheduled:
+            # Новые обновления уже назначили сброс — он заберёт и возвращённую пачку.
+            return delay
+        _flush_scheduled = True
+    timer = threading.Timer(delay, _submit_flush)
+    timer.daemon = True
+    timer.start()
+    return delay
+
+
+def _submit_flush():
+    try:
+        _WRITE_EXECUTOR.submit(flush_preferences)
+    except RuntimeError:
+        # Пул писателя уже закрыт при выходе — буфер допишет flush_preferences из atexit.
+        pass
+
+
+def _requeue_preferences(preferences: list, feedback: list):
+    with _pending_lock:
+        for user_id, *values in preferences:
+            pending = _pending_preferences.setdefault(user_id, [None, None, None])
+            # Пока шла запись, могли прийти более свежие значения — они важнее возвращённых.
+            for idx, value in enumerate(values):
+                if pending[idx] is None:
+                    pending[idx] = value
+        for user_id, liked, disliked in feedback:
+            counts = _pending_feedback.setdefault(user_id, [0, 0])
+            counts[0] += liked
+            counts[1] += disliked
+
+
+# Регистрируется после _close_shared_conns, поэтому при выходе отрабатывает раньше закрытия соединений.
+atexit.register(flush_preferences)
+
+
+async def save_user_state_async(
+    user_id: int,
+    *,
+    category: Optional[str] = None,
+    mode: Optional[str] = None,
+    city: Optional[str] = None,
+    last_action: Optional[str] = None,
+):
+    await run_write(save_user_state, user_id, category=category, mode=mode, city=city, last_action=last_action)
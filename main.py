@@ -4,11 +4,13 @@ import random
 import re
 import logging
 import io
+import json
 import sqlite3
+import time
 import uuid
 from datetime import datetime
-from contextlib import closing
 from enum import IntEnum
+from functools import lru_cache
 from typing import Dict, Iterable, Optional
 from urllib.parse import quote_plus
 
@@ -25,7 +27,7 @@ from telegram import (
     BotCommand,
 )
 from telegram.constants import ChatAction
-from telegram.error import Forbidden, TelegramError, TimedOut
+from telegram.error import BadRequest, Forbidden, TelegramError, TimedOut
 from telegram.ext import (
     ApplicationBuilder,
     CallbackQueryHandler,
@@ -33,6 +35,7 @@ from telegram.ext import (
     ConversationHandler,
     ContextTypes,
     MessageHandler,
+    TypeHandler,
     filters,
     Application,
 )
@@ -40,13 +43,14 @@ from telegram.request import HTTPXRequest
 import httpx
 
 from db import (
-    get_conn,
     init_db,
-    increment_preference_feedback,
-    upsert_user_preferences,
+    queue_preference_feedback,
+    queue_user_preferences,
     load_user_state,
-    save_user_state,
+    save_user_state_async,
     log_item_feedback,
+    run_write,
+    shared_conn,
 )
 
 load_dotenv()
@@ -189,6 +193,20 @@ MODE_TOKENS = {
     "restaurant": ("🏙", "завед", "место", "restaurant", "кафе"),
 }
 
+
+def _token_pattern(tokens: Iterable[str]) -> "re.Pattern[str]":
+    return re.compile("|".join(map(re.escape, sorted(set(tokens), key=len, reverse=True))))
+
+
+# Токены каждой категории — одна скомпилированная альтернатива: один проход по тексту вместо
+# десятка проверок `in`. Порядок словарей сохраняется, поэтому побеждает та же категория, что и раньше.
+_MODE_PATTERNS = tuple((mode, _token_pattern(tokens)) for mode, tokens in MODE_TOKENS.items())
+_TASTE_PATTERNS = tuple((cat, _token_pattern(tokens)) for cat, tokens in TASTE_TOKENS.items())
+_TASTE_COMPACT_PATTERNS = tuple(
+    (cat, _token_pattern(token.strip().lower().replace(" ", "") for token in tokens if token.strip()))
+    for cat, tokens in TASTE_TOKENS.items()
+)
+
 SYNONYMS = {
     "чизкейк": ["cheesecake", "десерт", "sweet", "сырный торт"],
     "брауни": ["brownie", "десерт", "шоколад"],
@@ -217,6 +235,20 @@ SYNONYMS = {
     "здоровое": ["healthy", "боул", "овощи"],
 }
 
+# Ключи синонимов ищутся в запросе одним проходом: lookahead даёт совпадение на каждой позиции
+# (длинный ключ первым), а ключи, вложенные в найденный, берём из заранее собранного индекса.
+_SYNONYM_KEY_PATTERN = re.compile(
+    "(?=(" + "|".join(map(re.escape, sorted(SYNONYMS, key=len, reverse=True))) + "))"
+)
+_SYNONYM_SUBKEYS = {key: [other for other in SYNONYMS if other in key] for key in SYNONYMS}
+_SYNONYM_OWNERS = {
+    word: [key for key, group in SYNONYMS.items() if word in group]
+    for group in SYNONYMS.values()
+    for word in group
+}
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_TERM_SUFFIXES = ("ы", "а", "ой", "ий", "я", "ь")
+
 CATEGORY_HINTS = {
     "чизкейк": "sweet",
     "брауни": "sweet",
@@ -317,23 +349,45 @@ def pick_bridge_phrase() -> str:
     return random.choice(AI_BRIDGE_PHRASES)
 
 
+def _initial_user_state(stored) -> Dict[str, Optional[str]]:
+    return {
+        "mode": stored.mode,
+        "category": stored.category,
+        "city": stored.city,
+        "last_action": stored.last_action,
+        "last_query": None,
+        "last_choice": None,
+        PROCESSING_RANDOM: False,
+        PROCESSING_CATEGORY: False,
+    }
+
+
 def ensure_user_state(user_id: int) -> Dict[str, Optional[str]]:
+    # Обычно состояние уже подгружено preload_user_context; синхронное чтение — запасной путь.
     if user_id not in USER_STATE:
-        stored = load_user_state(user_id)
-        USER_STATE[user_id] = {
-            "mode": stored.get("mode"),
-            "category": stored.get("category"),
-            "city": stored.get("city"),
-            "last_action": stored.get("last_action"),
-            "last_query": None,
-            "last_choice": None,
-            PROCESSING_RANDOM: False,
-            PROCESSING_CATEGORY: False,
-        }
+        USER_STATE[user_id] = _initial_user_state(load_user_state(user_id))
     return USER_STATE[user_id]
 
 
-def remember_context(
+async def preload_user_context(update: object, context: ContextTypes.DEFAULT_TYPE):
+    # Группа -1 отрабатывает раньше остальных обработчиков: состояние пользователя и список городов
+    # читаются из базы в пуле потоков, а синхронные ensure_user_state/known_cities дальше берут их из памяти.
+    if not isinstance(update, Update):
+        return
+    if update.effective_user:
+        user_id = update.effective_user.id
+    elif update.effective_chat:
+        user_id = update.effective_chat.id
+    else:
+        user_id = None
+    if user_id is not None and user_id not in USER_STATE:
+        stored = await asyncio.to_thread(load_user_state, user_id)
+        USER_STATE.setdefault(user_id, _initial_user_state(stored))
+    if time.monotonic() - _city_cache[0] >= _CITY_CACHE_TTL:
+        await asyncio.to_thread(known_cities)
+
+
+async def remember_context(
     user_id: int,
     *,
     mode: Optional[str] = None,
@@ -370,15 +424,12 @@ def remember_context(
         persistence_kwargs["last_action"] = last_action
     if persistence_kwargs:
         try:
-            save_user_state(user_id, **persistence_kwargs)
+            await save_user_state_async(user_id, **persistence_kwargs)
         except sqlite3.Error as exc:
             log.warning("Не удалось обновить user_state: %s", exc)
 
-    try:
-        if any(value is not None for value in (mode, category, query)):
-            upsert_user_preferences(user_id, mode=mode, category=category, query=query)
-    except sqlite3.Error as exc:
-        log.warning("Не удалось обновить user_preferences: %s", exc)
+    if any(value is not None for value in (mode, category, query)):
+        queue_user_preferences(user_id, mode=mode, category=category, query=query)
 
     snapshot = ensure_user_state(user_id)
     print(
@@ -434,8 +485,8 @@ def suggestion_id(item: Optional[dict]) -> Optional[str]:
     return item.get("id") or item.get("place_id")
 
 
-def log_ai_interaction(user_id: int, question: str, answer: str, status: str):
-    with closing(get_conn()) as conn, conn:
+def log_ai_interaction(conn, user_id: int, question: str, answer: str, status: str):
+    with conn:
         conn.execute(
             """
             INSERT INTO ai_logs(user_id, question, answer, status)
@@ -455,35 +506,40 @@ def log_ai_interaction(user_id: int, question: str, answer: str, status: str):
         log.warning("Не удалось записать ai_logs.txt: %s", exc)
 
 
-def save_ai_feedback(question: str, answer: str, user_id: int, liked: int):
-    with closing(get_conn()) as conn, conn:
-        conn.execute(
-            """
-            INSERT INTO ai_feedback(question, answer, user_id, liked)
-            VALUES (?,?,?,?)
-            """,
-            (question, answer, user_id, liked),
-        )
+def save_ai_feedback(conn, question: str, answer: str, user_id: int, liked: int):
+    conn.execute(
+        """
+        INSERT INTO ai_feedback(question, answer, user_id, liked)
+        VALUES (?,?,?,?)
+        """,
+        (question, answer, user_id, liked),
+    )
 
 
-def save_qa_entry(question: str, answer: str):
-    with closing(get_conn()) as conn, conn:
-        conn.execute(
-            """
-            INSERT OR IGNORE INTO qa(question, answer)
-            VALUES(?,?)
-            """,
-            (question, answer),
-        )
+def save_qa_entry(conn, question: str, answer: str):
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO qa(question, answer)
+        VALUES(?,?)
+        """,
+        (question, answer),
+    )
+
+
+def record_ai_feedback(conn, question: str, answer: str, user_id: int, liked: bool):
+    with conn:
+        save_ai_feedback(conn, question, answer, user_id, 1 if liked else 0)
+        if liked:
+            save_qa_entry(conn, question, answer)
+        update_taste_profile_from_text(conn, user_id, f"{question} {answer}", liked)
 
 
-def fetch_qa_answer(question: str):
+def fetch_qa_answer(conn, question: str):
     norm = normalize(question)
-    with closing(get_conn()) as conn:
-        row = conn.execute(
-            "SELECT answer, image FROM qa WHERE lower(question)=?",
-            (norm,),
-        ).fetchone()
+    row = conn.execute(
+        "SELECT answer, image FROM qa WHERE lower(question)=?",
+        (norm,),
+    ).fetchone()
     return row
 
 
@@ -520,12 +576,12 @@ async def generate_ai_answer(prompt: str, user_id: int, original_question: str,
     try:
         answer = await ai_service.ask_ai(prompt, mode=mode)
         status = "success" if answer else "empty"
-        log_ai_interaction(user_id, original_question, answer, status)
+        await run_db_write(log_ai_interaction, user_id, original_question, answer, status)
         if not answer:
             raise RuntimeError("Модель не вернула текста.")
         return answer
     except Exception as exc:
-        log_ai_interaction(user_id, original_question, "", f"error: {exc}")
+        await run_db_write(log_ai_interaction, user_id, original_question, "", f"error: {exc}")
         message = str(exc)
         if "404" in message and "models" in message:
             raise RuntimeError(
@@ -534,8 +590,46 @@ async def generate_ai_answer(prompt: str, user_id: int, original_question: str,
         raise
 
 
+# Одни и те же подписи кнопок и запросы приходят от множества пользователей — результат кешируем.
+@lru_cache(maxsize=4096)
 def normalize(text: Optional[str]) -> str:
-    return re.sub(r"\s+", " ", (text or "").strip().lower())
+    return _WHITESPACE_PATTERN.sub(" ", (text or "").strip().lower())
+
+
+_NORM_CONTROL_RANDOM = normalize(CONTROL_RANDOM)
+
+
+# Города меняются только когда админка правит рестораны, поэтому держим их в памяти с коротким TTL.
+_CITY_CACHE_TTL = 300.0
+_city_cache: tuple[float, dict[str, str]] = (0.0, {})
+
+
+def known_cities() -> dict[str, str]:
+    global _city_cache
+    loaded_at, norm_map = _city_cache
+    now = time.monotonic()
+    if norm_map and now - loaded_at < _CITY_CACHE_TTL:
+        return norm_map
+    try:
+        conn = shared_conn()
+        rows = conn.execute("SELECT DISTINCT city FROM restaurants WHERE city IS NOT NULL").fetchall()
+    except sqlite3.Error:
+        return norm_map
+    norm_map = {normalize(row["city"]): row["city"] for row in rows if row["city"]}
+    _city_cache = (now, norm_map)
+    return norm_map
+
+
+@lru_cache(maxsize=1)
+def load_synonym_rows() -> tuple[tuple[str, tuple[str, ...]], ...]:
+    # Таблицу synonyms пишет только ensure_synonyms() при старте — читаем её один раз, уже нормализованной.
+    rows = shared_conn().execute("SELECT word, alt_words FROM synonyms").fetchall()
+    loaded = []
+    for row in rows:
+        word = normalize(row["word"])
+        if word:
+            loaded.append((word, tuple(normalize(w) for w in (row["alt_words"] or "").split(",") if w)))
+    return tuple(loaded)
 
 
 def canonicalize_city(raw: Optional[str]) -> Optional[str]:
@@ -547,12 +641,7 @@ def canonicalize_city(raw: Optional[str]) -> Optional[str]:
     norm = normalize(text)
     if not norm:
         return text
-    try:
-        with closing(get_conn()) as conn:
-            rows = conn.execute("SELECT DISTINCT city FROM restaurants WHERE city IS NOT NULL").fetchall()
-    except sqlite3.Error:
-        rows = []
-    norm_map = {normalize(row["city"]): row["city"] for row in rows if row["city"]}
+    norm_map = known_cities()
     direct = norm_map.get(norm)
     if direct:
         return direct
@@ -564,8 +653,8 @@ def canonicalize_city(raw: Optional[str]) -> Optional[str]:
 
 def resolve_mode(text: str) -> Optional[str]:
     t = normalize(text)
-    for mode, tokens in MODE_TOKENS.items():
-        if any(token in t for token in tokens):
+    for mode, pattern in _MODE_PATTERNS:
+        if pattern.search(t):
             return mode
     return None
 
@@ -576,56 +665,72 @@ def resolve_category(text: str) -> Optional[str]:
         return None
     if "не знаю" in t or "random" in t or "🎲" in text:
         return "random"
-    for cat, tokens in TASTE_TOKENS.items():
-        if any(token in t for token in tokens):
+    for cat, pattern in _TASTE_PATTERNS:
+        if pattern.search(t):
             return cat
     return None
 
 
-def expand_terms(query: str) -> list[str]:
+@lru_cache(maxsize=4096)
+def expand_terms(query: str) -> tuple[str, ...]:
+    # Кортеж, а не список: результат общий для всех вызовов из кеша и не должен меняться.
     base = normalize(query)
     if not base:
-        return []
+        return ()
     terms = set([base])
-    for key, group in SYNONYMS.items():
-        if key in base:
-            terms.update(group)
-        if base == key:
-            terms.update(group)
-        if base in group:
-            terms.add(key)
-            terms.update(group)
+    for match in _SYNONYM_KEY_PATTERN.findall(base):
+        for key in _SYNONYM_SUBKEYS[match]:
+            terms.update(SYNONYMS[key])
+    for key in _SYNONYM_OWNERS.get(base, ()):
+        terms.add(key)
+        terms.update(SYNONYMS[key])
     terms.update(base.split())
-    terms.update({base.rstrip(suffix) for suffix in ("ы", "а", "ой", "ий", "я", "ь") if base.endswith(suffix)})
+    terms.update({base.rstrip(suffix) for suffix in _TERM_SUFFIXES if base.endswith(suffix)})
     try:
-        with closing(get_conn()) as conn:
-            rows = conn.execute("SELECT word, alt_words FROM synonyms").fetchall()
-        for row in rows:
-            word = normalize(row["word"])
-            if not word:
-                continue
-            alts = [normalize(w) for w in (row["alt_words"] or "").split(",") if w]
-            if word in base or base in word:
-                terms.add(word)
-                terms.update(alts)
-            if base in alts:
-                terms.add(word)
-                terms.update(alts)
+        synonym_rows = load_synonym_rows()
     except sqlite3.Error:
-        pass
-    return [t for t in terms if t]
+        synonym_rows = ()
+    for word, alts in synonym_rows:
+        if word in base or base in word or base in alts:
+            terms.add(word)
+            terms.update(alts)
+    return tuple(t for t in terms if t)
+
+
+def _list_media_paths() -> dict[str, str]:
+    try:
+        names = os.listdir("images")
+    except FileNotFoundError:
+        return {}
+    paths = {name: os.path.join("images", name) for name in names}
+    if "logo.jpg" not in paths and "happy.png" in paths:
+        paths["logo.jpg"] = paths["happy.png"]
+    return paths
+
+
+# Набор картинок в images/ фиксирован на время работы бота: путь берём из готового словаря, без stat().
+_MEDIA_PATHS = _list_media_paths()
 
 
 def get_media_path(name: Optional[str]) -> Optional[str]:
     if not name:
         return None
-    path = os.path.join("images", name)
-    if os.path.exists(path):
-        return path
-    if name == "logo.jpg":
-        fallback = os.path.join("images", "happy.png")
-        return fallback if os.path.exists(fallback) else None
-    return None
+    return _MEDIA_PATHS.get(name)
+
+
+@lru_cache(maxsize=64)
+def load_media(name: Optional[str]) -> Optional[tuple[str, bytes]]:
+    # Картинок несколько и они маленькие: читаем файл один раз, дальше отдаём байты из памяти,
+    # без stat() и open() в event loop на каждое сообщение.
+    path = get_media_path(name)
+    if not path:
+        return None
+    try:
+        with open(path, "rb") as media:
+            return os.path.basename(path), media.read()
+    except OSError as exc:
+        log.warning("Не удалось прочитать %s: %s", path, exc)
+        return None
 
 
 async def send_text_safely(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str, reply_markup=None):
@@ -658,18 +763,45 @@ async def send_text_safely(context: ContextTypes.DEFAULT_TYPE, chat_id: int, tex
         )
 
 
+# file_id, который Telegram вернул после первой загрузки картинки из images/: дальше шлём ссылку,
+# а не сам файл. Ключ — имя из _MEDIA_PATHS, так что словарь не больше папки с картинками;
+# удалённые фото (в том числе URL Google Places с ключом API) сюда не попадают.
+_PHOTO_FILE_IDS: dict[str, str] = {}
+
+
+def remember_photo_file_id(image: str, message) -> None:
+    photos = getattr(message, "photo", None)
+    if photos:
+        _PHOTO_FILE_IDS[image] = photos[-1].file_id
+
+
 async def send_visual(context: ContextTypes.DEFAULT_TYPE, chat_id: int, image: Optional[str], text: Optional[str],
                       reply_markup=None):
-    path = get_media_path(image)
     try:
-        if path:
-            with open(path, "rb") as photo:
+        file_id = _PHOTO_FILE_IDS.get(image) if image else None
+        if file_id:
+            try:
                 await context.bot.send_photo(
                     chat_id=chat_id,
-                    photo=InputFile(photo, filename=os.path.basename(path)),
+                    photo=file_id,
                     caption=text,
                     reply_markup=reply_markup,
                 )
+                return
+            except BadRequest as exc:
+                # file_id устарел или отозван — забываем его и загружаем файл заново.
+                log.warning("Cached file_id for %s rejected: %s", image, exc)
+                _PHOTO_FILE_IDS.pop(image, None)
+        media = load_media(image)
+        if media:
+            filename, data = media
+            message = await context.bot.send_photo(
+                chat_id=chat_id,
+                photo=InputFile(data, filename=filename),
+                caption=text,
+                reply_markup=reply_markup,
+            )
+            remember_photo_file_id(image, message)
         elif image and image.startswith(("http://", "https://")):
             try:
                 async with httpx.AsyncClient(follow_redirects=True, timeout=10) as client:
@@ -700,7 +832,6 @@ async def send_thinking(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text:
         await context.bot.send_chat_action(chat_id, ChatAction.TYPING)
         if notify and text:
             await send_text_safely(context, chat_id, text)
-        await asyncio.sleep(0.4)
     except Forbidden:
         log.warning("Cannot notify chat %s – bot blocked or not started.", chat_id)
     except TelegramError as exc:
@@ -730,7 +861,7 @@ async def handle_ai_question(
     user_id = update.effective_user.id if update.effective_user else chat_id
 
     if not session_id and not direct_mode:
-        row = fetch_qa_answer(question)
+        row = await run_db(fetch_qa_answer, question)
         if row:
             answer, image = row["answer"], row["image"]
             prefix = "Нашёл ответ в базе знаний 👇\n\n"
@@ -836,17 +967,14 @@ async def ai_feedback_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     chat_id = query.message.chat.id if query.message and query.message.chat else user_id
 
     if action == "ai_like":
-        save_ai_feedback(question, answer, user_id, 1)
-        save_qa_entry(question, answer)
-        update_taste_profile_from_text(user_id, f"{question} {answer}", True)
+        await run_db_write(record_ai_feedback, question, answer, user_id, True)
         sessions.pop(session_id, None)
         await query.edit_message_reply_markup(None)
         await query.message.reply_text("❤️ Спасибо! Я запомнил этот ответ.")
         return
 
     if action == "ai_dislike":
-        save_ai_feedback(question, answer, user_id, 0)
-        update_taste_profile_from_text(user_id, f"{question} {answer}", False)
+        await run_db_write(record_ai_feedback, question, answer, user_id, False)
         session["rejections"] = session.get("rejections", 0) + 1
         if session["rejections"] >= AI_REJECT_LIMIT:
             sessions.pop(session_id, None)
@@ -911,13 +1039,28 @@ def get_selected_category(context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
     return context.user_data.get(SELECTED_CATEGORY_KEY)
 
 
-def get_user(chat_id: int):
-    with closing(get_conn()) as conn:
-        return conn.execute("SELECT * FROM users WHERE chat_id=?", (chat_id,)).fetchone()
+_USER_CACHE: dict[int, dict] = {}
+_USER_CACHE_MAX = 10_000
 
 
-def upsert_user(chat_id: int, name: str, age: int, city: str):
-    with closing(get_conn()) as conn, conn:
+def get_user(chat_id: int) -> Optional[dict]:
+    # Профиль меняется только при регистрации, так что /start берёт его из памяти.
+    cached = _USER_CACHE.get(chat_id)
+    if cached is not None:
+        return cached
+    row = shared_conn().execute("SELECT * FROM users WHERE chat_id=?", (chat_id,)).fetchone()
+    if row is None:
+        # Промахи не кэшируем: пользователь вот-вот зарегистрируется.
+        return None
+    if len(_USER_CACHE) >= _USER_CACHE_MAX:
+        _USER_CACHE.pop(next(iter(_USER_CACHE)), None)
+    # dict, а не sqlite3.Row: объект живёт в кэше дольше запроса.
+    user = _USER_CACHE[chat_id] = dict(row)
+    return user
+
+
+def upsert_user(conn, chat_id: int, name: str, age: int, city: str):
+    with conn:
         conn.execute(
             """
             INSERT INTO users(chat_id, name, age, city)
@@ -929,15 +1072,19 @@ def upsert_user(chat_id: int, name: str, age: int, city: str):
             """,
             (chat_id, name, age, city),
         )
+    _USER_CACHE.pop(chat_id, None)
 
 
 def ensure_synonyms():
-    with closing(get_conn()) as conn, conn:
+    conn = shared_conn()
+    with conn:
         for word, alts in SYNONYMS.items():
             conn.execute(
                 "INSERT OR IGNORE INTO synonyms(word, alt_words) VALUES(?,?)",
                 (word, ",".join(alts)),
             )
+    load_synonym_rows.cache_clear()
+    expand_terms.cache_clear()
 
 
 def detect_category_from_text(*values: Optional[str]) -> Optional[str]:
@@ -949,11 +1096,9 @@ def detect_category_from_text(*values: Optional[str]) -> Optional[str]:
     if not text:
         return None
     compact = text.replace(" ", "")
-    for cat, tokens in TASTE_TOKENS.items():
-        for token in tokens:
-            normalized_token = token.strip().lower().replace(" ", "")
-            if normalized_token and normalized_token in compact:
-                return cat
+    for cat, pattern in _TASTE_COMPACT_PATTERNS:
+        if pattern.search(compact):
+            return cat
     for hint, cat in CATEGORY_HINTS.items():
         normalized_hint = hint.strip().lower()
         if normalized_hint and normalized_hint in text:
@@ -1076,6 +1221,17 @@ def row_dict(row) -> dict:
     return dict(row) if row else {}
 
 
+async def run_db(func, *args, **kwargs):
+    # Поиск по базе уводим из event loop в пул потоков: у каждого потока своё соединение из shared_conn(),
+    # так что параллельные чаты не ждут друг друга на sqlite.
+    return await asyncio.to_thread(lambda: func(shared_conn(), *args, **kwargs))
+
+
+async def run_db_write(func, *args, **kwargs):
+    # Записи — в единственном потоке-писателе из db.py, со своим соединением этого потока.
+    return await run_write(lambda: func(shared_conn(), *args, **kwargs))
+
+
 def resolve_random_category(conn, chat_id: int, fallback: Optional[str]) -> Optional[str]:
     if fallback and fallback != "random":
         return fallback
@@ -1096,9 +1252,47 @@ def resolve_random_category(conn, chat_id: int, fallback: Optional[str]) -> Opti
     return random.choice(DEFAULT_TASTES)
 
 
+def search_haystack(*columns: str) -> str:
+    # Поля склеиваются в одну строку для одного instr() вместо LIKE '%x%' по каждому столбцу.
+    # Разделитель — перевод строки: нормализованный терм его не содержит и не «перешагнёт» границу полей.
+    return "lower(" + " || char(10) || ".join(f"coalesce({column}, '')" for column in columns) + ")"
+
+
+_RECIPE_TERMS_HAY = search_haystack("title", "tags", "keywords")
+_RECIPE_CATEGORY_HAY = search_haystack("category", "tags", "keywords")
+_RESTAURANT_TERMS_HAY = search_haystack("name", "tags", "keywords", "cuisine")
+_RESTAURANT_CATEGORY_HAY = search_haystack("category", "tags", "keywords", "cuisine")
+_RESTAURANT_HINTS_HAY = search_haystack("tags", "keywords", "cuisine")
+
+
+def split_fts_terms(terms: Iterable[str]) -> tuple[list[str], list[str]]:
+    # trigram-индекс находит подстроки от трёх символов; более короткие термы ищем через instr().
+    long_terms: list[str] = []
+    short_terms: list[str] = []
+    for term in terms:
+        norm = normalize(term)
+        if not norm:
+            continue
+        (long_terms if len(norm) >= 3 else short_terms).append(norm)
+    return long_terms, short_terms
+
+
+def short_terms_clause(haystack: str) -> str:
+    # Все короткие термы — один параметр-JSON: форма SQL не зависит от их числа,
+    # и кеш подготовленных выражений sqlite3 (cached_statements) срабатывает на каждом запросе.
+    return f"EXISTS (SELECT 1 FROM json_each(?) WHERE instr({haystack}, value) > 0)"
+
+
+def fts_match_expr(terms: list[str], columns: Optional[tuple[str, ...]] = None) -> str:
+    phrases = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+    if columns:
+        return "{" + " ".join(columns) + "} : (" + phrases + ")"
+    return phrases
+
+
 def fetch_recipes(
     conn,
-    terms: list[str],
+    terms: Iterable[str],
     taste: Optional[str],
     limit: int = 3,
     primary: Optional[str] = None,
@@ -1107,15 +1301,17 @@ def fetch_recipes(
     clauses = []
     filter_params: list = []
     if terms:
+        long_terms, short_terms = split_fts_terms(terms)
         term_clauses = []
-        for term in terms:
-            norm = normalize(term)
-            if not norm:
-                continue
-            like = f"%{norm}%"
-            term_clauses.append("(lower(title) LIKE ? OR lower(tags) LIKE ? OR lower(keywords) LIKE ?)")
-            filter_params.extend([like, like, like])
-        clauses.append("(" + " OR ".join(term_clauses) + ")")
+        if long_terms:
+            # Все термы — один MATCH по индексу вместо трёх LIKE-сканов на каждый.
+            term_clauses.append("id IN (SELECT rowid FROM recipes_fts WHERE recipes_fts MATCH ?)")
+            filter_params.append(fts_match_expr(long_terms))
+        if short_terms:
+            term_clauses.append(short_terms_clause(_RECIPE_TERMS_HAY))
+            filter_params.append(json.dumps(short_terms, ensure_ascii=False))
+        if term_clauses:
+            clauses.append("(" + " OR ".join(term_clauses) + ")")
     category_filter = selected_category or (taste if taste and taste != "random" else None)
     fallback_clause = None
     fallback_params: list = []
@@ -1123,16 +1319,17 @@ def fetch_recipes(
         normalized_category = category_filter.lower()
         clauses.append("LOWER(category)=?")
         filter_params.append(normalized_category)
-        like = f"%{normalized_category}%"
-        fallback_clause = "(LOWER(category) LIKE ? OR LOWER(tags) LIKE ? OR LOWER(keywords) LIKE ?)"
-        fallback_params = [like, like, like]
+        fallback_clause = f"instr({_RECIPE_CATEGORY_HAY}, ?) > 0"
+        fallback_params = [normalized_category]
     score_expr = "0"
     score_params: list = []
     primary_norm = normalize(primary) if primary else ""
     if primary_norm:
-        like = f"%{primary_norm}%"
-        score_expr = "(CASE WHEN lower(title) LIKE ? THEN 3 WHEN lower(tags) LIKE ? THEN 2 WHEN lower(keywords) LIKE ? THEN 1 ELSE 0 END)"
-        score_params = [like, like, like]
+        score_expr = (
+            "(CASE WHEN instr(lower(title), ?) > 0 THEN 3 WHEN instr(lower(tags), ?) > 0 THEN 2 "
+            "WHEN instr(lower(keywords), ?) > 0 THEN 1 ELSE 0 END)"
+        )
+        score_params = [primary_norm, primary_norm, primary_norm]
 
     def run_query(active_clauses: list[str], active_params: list) -> list[dict]:
         where = "WHERE " + " AND ".join(active_clauses) if active_clauses else ""
@@ -1152,9 +1349,8 @@ def fetch_recipes(
 
 
 async def fetch_restaurants(
-    conn,
     city: str,
-    terms: list[str],
+    terms: Iterable[str],
     taste: Optional[str],
     limit: int = 3,
     primary: Optional[str] = None,
@@ -1172,15 +1368,16 @@ async def fetch_restaurants(
         "healthy": ["полез", "здоров", "боул", "овощ", "healthy"],
     }
     if terms:
+        long_terms, short_terms = split_fts_terms(terms)
         term_clauses = []
-        for term in terms:
-            norm = normalize(term)
-            if not norm:
-                continue
-            like = f"%{norm}%"
-            term_clauses.append("(lower(name) LIKE ? OR lower(tags) LIKE ? OR lower(keywords) LIKE ? OR lower(cuisine) LIKE ?)")
-            filter_params.extend([like, like, like, like])
-        clauses.append("(" + " OR ".join(term_clauses) + ")")
+        if long_terms:
+            term_clauses.append("id IN (SELECT rowid FROM restaurants_terms_fts WHERE restaurants_terms_fts MATCH ?)")
+            filter_params.append(fts_match_expr(long_terms))
+        if short_terms:
+            term_clauses.append(short_terms_clause(_RESTAURANT_TERMS_HAY))
+            filter_params.append(json.dumps(short_terms, ensure_ascii=False))
+        if term_clauses:
+            clauses.append("(" + " OR ".join(term_clauses) + ")")
     category_filter = selected_category or (taste if taste and taste != "random" else None)
     fallback_clause = None
     fallback_params: list = []
@@ -1188,29 +1385,31 @@ async def fetch_restaurants(
         normalized_category = category_filter.lower()
         clauses.append("LOWER(category)=?")
         filter_params.append(normalized_category)
-        like = f"%{normalized_category}%"
-        fallback_clause = "(LOWER(category) LIKE ? OR LOWER(tags) LIKE ? OR LOWER(keywords) LIKE ? OR LOWER(cuisine) LIKE ?)"
-        fallback_params = [like, like, like, like]
+        fallback_clause = f"instr({_RESTAURANT_CATEGORY_HAY}, ?) > 0"
+        fallback_params = [normalized_category]
     elif taste and taste != "random":
         hints = taste_hints.get(taste, [taste])
+        long_hints, short_hints = split_fts_terms(hints)
         hint_clauses = []
-        for hint in hints:
-            norm = normalize(hint)
-            if not norm:
-                continue
-            like = f"%{norm}%"
-            hint_clauses.append("(lower(tags) LIKE ? OR lower(keywords) LIKE ? OR lower(cuisine) LIKE ?)")
-            filter_params.extend([like, like, like])
-        clauses.append("(" + " OR ".join(hint_clauses) + ")")
+        if long_hints:
+            hint_clauses.append("id IN (SELECT rowid FROM restaurants_terms_fts WHERE restaurants_terms_fts MATCH ?)")
+            filter_params.append(fts_match_expr(long_hints, ("tags", "keywords", "cuisine")))
+        if short_hints:
+            hint_clauses.append(short_terms_clause(_RESTAURANT_HINTS_HAY))
+            filter_params.append(json.dumps(short_hints, ensure_ascii=False))
+        if hint_clauses:
+            clauses.append("(" + " OR ".join(hint_clauses) + ")")
     if not clauses:
         clauses.append("1=1")
     score_expr = "0"
     score_params: list = []
     primary_norm = normalize(primary) if primary else ""
     if primary_norm:
-        like = f"%{primary_norm}%"
-        score_expr = "(CASE WHEN lower(name) LIKE ? THEN 3 WHEN lower(tags) LIKE ? THEN 2 WHEN lower(keywords) LIKE ? THEN 1 ELSE 0 END)"
-        score_params = [like, like, like]
+        score_expr = (
+            "(CASE WHEN instr(lower(name), ?) > 0 THEN 3 WHEN instr(lower(tags), ?) > 0 THEN 2 "
+            "WHEN instr(lower(keywords), ?) > 0 THEN 1 ELSE 0 END)"
+        )
+        score_params = [primary_norm, primary_norm, primary_norm]
 
     city_norm = normalize(city)
     if city_norm and city_norm != normalize("Астана"):
@@ -1230,13 +1429,13 @@ async def fetch_restaurants(
                 place["category"] = taste_for_google
         return google_results[:limit]
 
-    def run_query(active_clauses: list[str], active_params: list) -> list[dict]:
+    def run_query(query_conn, active_clauses: list[str], active_params: list) -> list[dict]:
         where = "WHERE " + " AND ".join(active_clauses)
         sql = f"SELECT *, {score_expr} AS match_score FROM restaurants {where} ORDER BY match_score DESC, rating DESC, RANDOM() LIMIT ?"
         params = score_params + active_params + [limit]
-        return list(map(row_dict, conn.execute(sql, params).fetchall()))
+        return list(map(row_dict, query_conn.execute(sql, params).fetchall()))
 
-    rows = run_query(clauses, filter_params)
+    rows = await run_db(run_query, clauses, filter_params)
     if rows or not category_filter or selected_category or not fallback_clause:
         enriched = rows
     else:
@@ -1244,7 +1443,7 @@ async def fetch_restaurants(
         fallback_params_all = filter_params[:-1]
         fallback_clauses.append(fallback_clause)
         fallback_params_all.extend(fallback_params)
-        enriched = run_query(fallback_clauses, fallback_params_all)
+        enriched = await run_db(run_query, fallback_clauses, fallback_params_all)
 
     if len(enriched) >= limit or not city:
         return enriched
@@ -1266,6 +1465,31 @@ async def fetch_restaurants(
     return enriched
 
 
+# id рецептов по форме фильтра: случайный выбор — random.choice по списку и выборка по первичному ключу
+# вместо ORDER BY RANDOM(), который сортирует всю таблицу на каждый шаг карусели.
+_RECIPE_IDS_TTL = 300.0
+_recipe_ids_cache: dict[tuple, tuple[float, list[int]]] = {}
+
+
+def pick_random_recipe(conn, where: str, params: list):
+    key = (where, tuple(params))
+    now = time.monotonic()
+    cached = _recipe_ids_cache.get(key)
+    if cached and now - cached[0] < _RECIPE_IDS_TTL:
+        ids = cached[1]
+    else:
+        ids = [row[0] for row in conn.execute(f"SELECT id FROM recipes{where}", params)]
+        _recipe_ids_cache[key] = (now, ids)
+    if not ids:
+        return None
+    row = conn.execute("SELECT * FROM recipes WHERE id=?", (random.choice(ids),)).fetchone()
+    if row is None:
+        # Рецепт удалили из админки, пока список жил в кэше, — перечитываем его.
+        _recipe_ids_cache.pop(key, None)
+        return pick_random_recipe(conn, where, params)
+    return row
+
+
 def fetch_random_recipe(
     conn,
     chat_id: int,
@@ -1279,18 +1503,15 @@ def fetch_random_recipe(
     if category and category != "random":
         clauses.append("LOWER(category)=?")
         params.append(category.lower())
-    base_sql = "SELECT * FROM recipes"
     where = " WHERE " + " AND ".join(clauses) if clauses else ""
-    row = conn.execute(f"{base_sql}{where} ORDER BY RANDOM() LIMIT 1", params).fetchone()
+    row = pick_random_recipe(conn, where, params)
     if not row and category and category != "random" and not selected_category:
         clauses_without_category = clauses[:-1]
         params_without_category = params[:-1]
-        like = f"%{category.lower()}%"
-        fallback_clause = "(LOWER(category) LIKE ? OR LOWER(tags) LIKE ? OR LOWER(keywords) LIKE ?)"
-        clauses_without_category.append(fallback_clause)
-        params_without_category.extend([like, like, like])
+        clauses_without_category.append(f"instr({_RECIPE_CATEGORY_HAY}, ?) > 0")
+        params_without_category.append(category.lower())
         where = " WHERE " + " AND ".join(clauses_without_category) if clauses_without_category else ""
-        row = conn.execute(f"{base_sql}{where} ORDER BY RANDOM() LIMIT 1", params_without_category).fetchone()
+        row = pick_random_recipe(conn, where, params_without_category)
     data = row_dict(row)
     if data:
         if not data.get("category"):
@@ -1342,8 +1563,41 @@ async def ai_fallback_place(city: str, taste: Optional[str]) -> Optional[dict]:
     }
 
 
+def query_random_places(conn, city: str, category: Optional[str], selected_category: Optional[str]) -> list[dict]:
+    clauses = []
+    params: list = []
+
+    if city:
+        clauses.append("city=?")
+        params.append(city)
+    else:
+        clauses.append("1=1")
+
+    if category and category != "random":
+        clauses.append("LOWER(category)=?")
+        params.append(category.lower())
+
+    base_sql = "SELECT * FROM restaurants WHERE " + " AND ".join(clauses)
+
+    rows: list[dict] = []
+    if category and category != "random":
+        fetched = conn.execute(base_sql + " ORDER BY rating DESC, RANDOM() LIMIT 3", params).fetchall()
+        rows = list(map(row_dict, fetched))
+        if not rows and not selected_category:
+            clauses_without_category = clauses[:-1]
+            params_without_category = params[:-1]
+            clauses_without_category.append(f"instr({_RESTAURANT_CATEGORY_HAY}, ?) > 0")
+            params_without_category.append(category.lower())
+            fallback_sql = "SELECT * FROM restaurants WHERE " + " AND ".join(clauses_without_category)
+            fetched = conn.execute(fallback_sql + " ORDER BY rating DESC, RANDOM() LIMIT 3", params_without_category).fetchall()
+            rows = list(map(row_dict, fetched))
+    else:
+        fetched = conn.execute(base_sql + " ORDER BY rating DESC, RANDOM() LIMIT 3", params).fetchall()
+        rows = list(map(row_dict, fetched))
+    return rows
+
+
 async def fetch_random_place(
-    conn,
     chat_id: int,
     city: str,
     taste: Optional[str],
@@ -1351,7 +1605,7 @@ async def fetch_random_place(
     selected_category: Optional[str] = None,
     context: Optional[ContextTypes.DEFAULT_TYPE] = None,
 ) -> list[dict]:
-    category = selected_category or resolve_random_category(conn, chat_id, taste)
+    category = selected_category or await run_db(resolve_random_category, chat_id, taste)
     city_norm = normalize(city)
 
     # Для любых городов, кроме Астаны, только Google (с широким повторным запросом)
@@ -1378,39 +1632,7 @@ async def fetch_random_place(
             fallback = await ai_fallback_place(city, category_for_google)
             return [fallback] if fallback else []
         return google_results
-    clauses = []
-    params: list = []
-
-    if city:
-        clauses.append("city=?")
-        params.append(city)
-    else:
-        clauses.append("1=1")
-
-    if category and category != "random":
-        clauses.append("LOWER(category)=?")
-        params.append(category.lower())
-
-    base_sql = "SELECT * FROM restaurants WHERE " + " AND ".join(clauses)
-
-    rows: list[dict] = []
-    if category and category != "random":
-        fetched = conn.execute(base_sql + " ORDER BY rating DESC, RANDOM() LIMIT 3", params).fetchall()
-        rows = list(map(row_dict, fetched))
-        if not rows and not selected_category:
-            clauses_without_category = clauses[:-1]
-            params_without_category = params[:-1]
-            like = f"%{category.lower()}%"
-            fallback_clause = "(LOWER(category) LIKE ? OR LOWER(tags) LIKE ? OR LOWER(keywords) LIKE ? OR LOWER(cuisine) LIKE ?)"
-            clauses_without_category.append(fallback_clause)
-            params_without_category.extend([like, like, like, like])
-            fallback_sql = "SELECT * FROM restaurants WHERE " + " AND ".join(clauses_without_category)
-            fetched = conn.execute(fallback_sql + " ORDER BY rating DESC, RANDOM() LIMIT 3", params_without_category).fetchall()
-            rows = list(map(row_dict, fetched))
-    else:
-        fetched = conn.execute(base_sql + " ORDER BY rating DESC, RANDOM() LIMIT 3", params).fetchall()
-        rows = list(map(row_dict, fetched))
-
+    rows = await run_db(query_random_places, city, category, selected_category)
     for data in rows:
         if not data.get("category"):
             detected_category = detect_category_from_text(data.get("tags"), data.get("keywords"))
@@ -1569,30 +1791,44 @@ def apply_feedback(conn, chat_id: int, item: dict, item_type: str, liked: bool):
             "UPDATE recipes SET likes = likes + ? WHERE id=?",
             (1 if liked else 0, item.get("id")),
         )
-    try:
-        increment_preference_feedback(chat_id, liked, conn=conn)
-    except sqlite3.Error as exc:
-        log.warning("Не удалось обновить user_preferences по фидбеку: %s", exc)
 
 
-def update_taste_profile_from_text(chat_id: int, text: str, liked: bool):
-    category = detect_category_from_text(text)
-    if not category:
-        return
-    with closing(get_conn()) as conn, conn:
+def record_item_feedback(conn, chat_id: int, user_id: int, item: dict, item_type: str, action: str):
+    # Все записи по фидбеку — одна транзакция в потоке-писателе.
+    with conn:
+        if action in ("like", "dislike"):
+            apply_feedback(conn, chat_id, item, item_type, action == "like")
+        log_item_feedback(user_id, suggestion_id(item), item_type, action, conn=conn)
+
+
+def save_place_favorite(conn, chat_id: int, place_id: str, name: str, address: str, photo_url: Optional[str]):
+    with conn:
         conn.execute(
             """
-            INSERT INTO user_tastes(chat_id, category, likes, dislikes)
-            VALUES (?,?,?,?)
-            ON CONFLICT(chat_id, category) DO UPDATE SET
-                likes = likes + excluded.likes,
-                dislikes = dislikes + excluded.dislikes,
-                updated_at = CURRENT_TIMESTAMP
+            INSERT OR IGNORE INTO favorite_places(chat_id, place_id, name, address, photo_url)
+            VALUES(?,?,?,?,?)
             """,
-            (chat_id, category, 1 if liked else 0, 0 if liked else 1),
+            (chat_id, place_id, name, address, photo_url),
         )
 
 
+def update_taste_profile_from_text(conn, chat_id: int, text: str, liked: bool):
+    category = detect_category_from_text(text)
+    if not category:
+        return
+    conn.execute(
+        """
+        INSERT INTO user_tastes(chat_id, category, likes, dislikes)
+        VALUES (?,?,?,?)
+        ON CONFLICT(chat_id, category) DO UPDATE SET
+            likes = likes + excluded.likes,
+            dislikes = dislikes + excluded.dislikes,
+            updated_at = CURRENT_TIMESTAMP
+        """,
+        (chat_id, category, 1 if liked else 0, 0 if liked else 1),
+    )
+
+
 def fetch_recipe_by_id(conn, rid: int) -> Optional[dict]:
     return row_dict(conn.execute("SELECT * FROM recipes WHERE id=?", (rid,)).fetchone())
 
@@ -1619,8 +1855,7 @@ def top_taste(conn, chat_id: int) -> Optional[dict]:
 
 async def maybe_send_hint(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
     hinted = context.user_data.setdefault("hinted_categories", set())
-    with closing(get_conn()) as conn:
-        info = top_taste(conn, chat_id)
+    info = await run_db(top_taste, chat_id)
     if not info:
         return
     category = info["category"]
@@ -1642,13 +1877,11 @@ async def maybe_send_hint(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    init_db()
-    ensure_synonyms()
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id if update.effective_user else chat_id
     ensure_user_state(user_id)
     reset_session(context)
-    user = get_user(chat_id)
+    user = await asyncio.to_thread(get_user, chat_id)
     if not user:
         await send_visual(
             context,
@@ -1660,7 +1893,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ASK_NAME
 
     context.user_data.update({"name": user["name"], "city": user["city"], "stage": UserFlow.choosing_mode.name})
-    remember_context(user_id, city=user["city"])
+    await remember_context(user_id, city=user["city"])
     await send_visual(
         context,
         chat_id,
@@ -1701,7 +1934,8 @@ async def ask_city(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id if update.effective_user else chat_id
     city_canonical = canonicalize_city(city)
-    upsert_user(
+    await run_db_write(
+        upsert_user,
         chat_id,
         context.user_data.get("name", "друг"),
         context.user_data.get("age", 0),
@@ -1709,7 +1943,7 @@ async def ask_city(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     context.user_data["city"] = city_canonical
     context.user_data["stage"] = UserFlow.choosing_mode.name
-    remember_context(user_id, city=city_canonical)
+    await remember_context(user_id, city=city_canonical)
     await send_visual(
         context,
         chat_id,
@@ -1726,7 +1960,7 @@ async def choose_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id if update.effective_user else chat_id
     norm_text = normalize(text)
     state = ensure_user_state(user_id)
-    if norm_text == normalize(CONTROL_RANDOM):
+    if norm_text == _NORM_CONTROL_RANDOM:
         if is_processing_random(user_id):
             return ASK_QUERY
         mode_choice = state.get("mode") or context.user_data.get("mode") or "recipe"
@@ -1743,7 +1977,7 @@ async def choose_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if taste_choice:
             context.user_data["taste"] = taste_choice
         context.user_data["stage"] = UserFlow.waiting_for_input.name
-        remember_context(user_id, mode=mode_choice, category=taste_choice, last_action="random")
+        await remember_context(user_id, mode=mode_choice, category=taste_choice, last_action="random")
         context.user_data.pop(SKIP_NEXT_MESSAGE, None)
         set_processing_random(user_id, True)
         reaction = reaction_message(taste_choice)
@@ -1766,7 +2000,7 @@ async def choose_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if existing_category:
         context.user_data["taste"] = existing_category
         context.user_data["stage"] = UserFlow.waiting_for_input.name
-        remember_context(user_id, mode=mode, category=existing_category, last_action="mode")
+        await remember_context(user_id, mode=mode, category=existing_category, last_action="mode")
         label = category_short_label(existing_category)
         prompt = (
             f"Продолжаю искать рецепты про {label}. Напиши идею или жми 🎲."
@@ -1777,7 +2011,7 @@ async def choose_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ASK_QUERY
 
     context.user_data["stage"] = UserFlow.choosing_category.name
-    remember_context(user_id, mode=mode, last_action="mode")
+    await remember_context(user_id, mode=mode, last_action="mode")
     await send_visual(context, chat_id, CATEGORY_MEDIA["loading"], "🤔 Думаю, что тебе предложить…")
     await cozy_delay()
     prompt = "Что хочется сегодня приготовить?" if mode == "recipe" else "Что хочется сегодня попробовать?"
@@ -1792,7 +2026,7 @@ async def recipe_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     taste = context.user_data.get("taste") or state.get("category")
     context.user_data["mode"] = "recipe"
     context.user_data.pop(SKIP_NEXT_MESSAGE, None)
-    remember_context(user_id, mode="recipe", category=taste, last_action="mode_command")
+    await remember_context(user_id, mode="recipe", category=taste, last_action="mode_command")
     if taste:
         context.user_data["stage"] = UserFlow.waiting_for_input.name
         label = category_short_label(taste)
@@ -1820,7 +2054,7 @@ async def place_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     taste = context.user_data.get("taste") or state.get("category")
     context.user_data["mode"] = "restaurant"
     context.user_data.pop(SKIP_NEXT_MESSAGE, None)
-    remember_context(user_id, mode="restaurant", category=taste, last_action="mode_command")
+    await remember_context(user_id, mode="restaurant", category=taste, last_action="mode_command")
     if taste:
         context.user_data["stage"] = UserFlow.waiting_for_input.name
         label = category_short_label(taste)
@@ -1841,42 +2075,58 @@ async def place_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return CHOOSE_TASTE
 
 
-async def handle_control(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = normalize(update.message.text)
-    user_id = update.effective_user.id if update.effective_user else update.effective_chat.id
-    if text == normalize(CONTROL_BACK):
-        stage = context.user_data.get("stage")
-        if stage in (UserFlow.waiting_for_input.name, UserFlow.showing_result.name):
-            context.user_data["stage"] = UserFlow.choosing_category.name
-            context.user_data.pop(SKIP_NEXT_MESSAGE, None)
-            set_processing_random(user_id, False)
-            await update.message.reply_text("Окей, вернёмся к выбору вкуса 👇", reply_markup=taste_keyboard())
-            return CHOOSE_TASTE
-        context.user_data["stage"] = UserFlow.choosing_mode.name
-        context.user_data.pop(SKIP_NEXT_MESSAGE, None)
-        set_processing_random(user_id, False)
-        await update.message.reply_text("Возвращаю в главное меню 🏠", reply_markup=mode_keyboard())
-        return CHOOSE_MODE
-    if text == normalize(CONTROL_CATEGORY_MENU):
+async def _control_back(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    stage = context.user_data.get("stage")
+    if stage in (UserFlow.waiting_for_input.name, UserFlow.showing_result.name):
         context.user_data["stage"] = UserFlow.choosing_category.name
         context.user_data.pop(SKIP_NEXT_MESSAGE, None)
         set_processing_random(user_id, False)
-        set_processing_category(user_id, False)
-        remember_context(user_id, last_action="category_menu")
-        await update.message.reply_text("🧭 Вернёмся к выбору вкуса", reply_markup=taste_keyboard())
+        await update.message.reply_text("Окей, вернёмся к выбору вкуса 👇", reply_markup=taste_keyboard())
         return CHOOSE_TASTE
-    if text == normalize(CONTROL_FINISH):
-        name = context.user_data.get("name", "друг")
-        await send_visual(
-            context,
-            update.effective_chat.id,
-            CATEGORY_MEDIA["farewell"],
-            f"Рад был помочь, {name}! 😋\nЧтобы начать заново, напиши /start.",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        reset_session(context)
-        return ConversationHandler.END
-    return None
+    context.user_data["stage"] = UserFlow.choosing_mode.name
+    context.user_data.pop(SKIP_NEXT_MESSAGE, None)
+    set_processing_random(user_id, False)
+    await update.message.reply_text("Возвращаю в главное меню 🏠", reply_markup=mode_keyboard())
+    return CHOOSE_MODE
+
+
+async def _control_category_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    context.user_data["stage"] = UserFlow.choosing_category.name
+    context.user_data.pop(SKIP_NEXT_MESSAGE, None)
+    set_processing_random(user_id, False)
+    set_processing_category(user_id, False)
+    await remember_context(user_id, last_action="category_menu")
+    await update.message.reply_text("🧭 Вернёмся к выбору вкуса", reply_markup=taste_keyboard())
+    return CHOOSE_TASTE
+
+
+async def _control_finish(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    name = context.user_data.get("name", "друг")
+    await send_visual(
+        context,
+        update.effective_chat.id,
+        CATEGORY_MEDIA["farewell"],
+        f"Рад был помочь, {name}! 😋\nЧтобы начать заново, напиши /start.",
+        reply_markup=ReplyKeyboardRemove(),
+    )
+    reset_session(context)
+    return ConversationHandler.END
+
+
+# Подписи кнопок нормализуются один раз при загрузке; дальше — один поиск в словаре вместо цепочки if.
+_CONTROL_ACTIONS = {
+    normalize(CONTROL_BACK): _control_back,
+    normalize(CONTROL_CATEGORY_MENU): _control_category_menu,
+    normalize(CONTROL_FINISH): _control_finish,
+}
+
+
+async def handle_control(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    action = _CONTROL_ACTIONS.get(normalize(update.message.text))
+    if action is None:
+        return None
+    user_id = update.effective_user.id if update.effective_user else update.effective_chat.id
+    return await action(update, context, user_id)
 
 
 async def handle_taste(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1914,7 +2164,7 @@ async def handle_taste(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data["stage"] = UserFlow.waiting_for_input.name
         context.user_data.pop(SKIP_NEXT_MESSAGE, None)
         reaction = reaction_message(fallback_category)
-        remember_context(user_id, category=fallback_category, last_action="random")
+        await remember_context(user_id, category=fallback_category, last_action="random")
         await send_text_safely(context, chat_id, reaction, reply_markup=query_keyboard())
         await cozy_delay()
         if mode == "recipe":
@@ -1928,7 +2178,7 @@ async def handle_taste(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["taste"] = category
     set_selected_category(context, category)
     context.user_data["stage"] = UserFlow.waiting_for_input.name
-    remember_context(user_id, category=category, last_action="category_select")
+    await remember_context(user_id, category=category, last_action="category_select")
 
     if mode == "recipe":
         prompt = "Отлично! Напиши, что ты примерно хочешь поесть, а я подберу лучший вариант 🍽 А если пока не решил — нажми на 🎲"
@@ -1993,7 +2243,7 @@ async def send_ai_suggestions(
     payload = "\n\n".join(paragraphs)
 
     await send_text_safely(context, chat_id, payload, reply_markup=query_keyboard())
-    remember_context(
+    await remember_context(
         user_id,
         mode=mode,
         category=category,
@@ -2032,12 +2282,14 @@ async def handle_no_results(
     )
 
 
-async def send_recipe_card(context: ContextTypes.DEFAULT_TYPE, chat_id: int, recipe: dict):
+async def send_recipe_card(context: ContextTypes.DEFAULT_TYPE, chat_id: int, recipe: dict, lead: Optional[str] = None):
     if not recipe:
         return
     category_label = recipe.get("category") or context.user_data.get("taste") or "unknown"
     print(f"[{category_label}] shown recipe: {recipe.get('title')}")
     intro = random.choice(RECIPE_INTROS)
+    if lead:
+        intro = f"{lead}\n{intro}"
     caption = (
         f"{intro}\n\n"
         f"🍽 {recipe['title']}\n"
@@ -2056,12 +2308,14 @@ async def send_recipe_card(context: ContextTypes.DEFAULT_TYPE, chat_id: int, rec
     update_last_suggestion(context, "recipe", suggestion_id(recipe))
 
 
-async def send_place_card(context: ContextTypes.DEFAULT_TYPE, chat_id: int, place: dict):
+async def send_place_card(context: ContextTypes.DEFAULT_TYPE, chat_id: int, place: dict, lead: Optional[str] = None):
     if not place:
         return
     category_label = place.get("category") or context.user_data.get("taste") or "unknown"
     print(f"[{category_label}] shown place: {place.get('name')}")
     intro = random.choice(PLACE_INTROS)
+    if lead:
+        intro = f"{lead}\n{intro}"
     rating = place.get("rating")
     cuisine = place.get("cuisine") or place.get("description") or ""
     address = place.get("address") or ""
@@ -2132,8 +2386,7 @@ async def send_random_recipe(update: Update, context: ContextTypes.DEFAULT_TYPE,
     state = ensure_user_state(user_id)
     preferred_taste = taste or context.user_data.get("taste") or state.get("category")
     explicit_category = get_selected_category(context)
-    with closing(get_conn()) as conn:
-        recipe = fetch_random_recipe(conn, chat_id, preferred_taste, selected_category=explicit_category)
+    recipe = await run_db(fetch_random_recipe, chat_id, preferred_taste, selected_category=explicit_category)
     if not recipe:
         context.user_data["stage"] = UserFlow.showing_result.name
         await handle_no_results(
@@ -2150,8 +2403,7 @@ async def send_random_recipe(update: Update, context: ContextTypes.DEFAULT_TYPE,
     last_recipe_id = get_last_suggestions(context).get("recipe")
     if suggestion_id(recipe) == last_recipe_id:
         for _ in range(3):
-            with closing(get_conn()) as conn:
-                alt = fetch_random_recipe(conn, chat_id, preferred_taste, selected_category=explicit_category)
+            alt = await run_db(fetch_random_recipe, chat_id, preferred_taste, selected_category=explicit_category)
             if not alt or suggestion_id(alt) != last_recipe_id:
                 recipe = alt or recipe
                 break
@@ -2159,7 +2411,7 @@ async def send_random_recipe(update: Update, context: ContextTypes.DEFAULT_TYPE,
     store_queue(context, "recipe", [recipe], {"kind": "random", "taste": category})
     context.user_data["taste"] = category
     context.user_data["stage"] = UserFlow.showing_result.name
-    remember_context(
+    await remember_context(
         user_id,
         mode=context.user_data.get("mode"),
         category=category,
@@ -2184,18 +2436,16 @@ async def send_random_place(update: Update, context: ContextTypes.DEFAULT_TYPE,
     # Не меняем город для Google, но для Астаны оставляем канонизацию
     city_canonical = canonicalize_city(city) if normalize(city) == normalize("Астана") else city
     context.user_data["city"] = city_canonical
-    remember_context(user_id, city=city_canonical)
+    await remember_context(user_id, city=city_canonical)
     preferred_taste = taste or context.user_data.get("taste") or state.get("category")
     explicit_category = get_selected_category(context)
-    with closing(get_conn()) as conn:
-        places = await fetch_random_place(
-            conn,
-            chat_id,
-            city_canonical,
-            preferred_taste,
-            selected_category=explicit_category,
-            context=context,
-        )
+    places = await fetch_random_place(
+        chat_id,
+        city_canonical,
+        preferred_taste,
+        selected_category=explicit_category,
+        context=context,
+    )
     if not places:
         ai_place = await ai_fallback_place(city_canonical, preferred_taste)
         if ai_place:
@@ -2233,15 +2483,13 @@ async def send_random_place(update: Update, context: ContextTypes.DEFAULT_TYPE,
             places = [first_place]
         else:
             # Сделаем ещё один запрос
-            with closing(get_conn()) as conn:
-                retry = await fetch_random_place(
-                    conn,
-                    chat_id,
-                    city_canonical,
-                    preferred_taste,
-                    selected_category=explicit_category,
-                    context=context,
-                )
+            retry = await fetch_random_place(
+                chat_id,
+                city_canonical,
+                preferred_taste,
+                selected_category=explicit_category,
+                context=context,
+            )
             if retry:
                 first_place = retry[0]
                 places = retry
@@ -2249,7 +2497,7 @@ async def send_random_place(update: Update, context: ContextTypes.DEFAULT_TYPE,
     store_queue(context, "place", places, {"kind": "random", "taste": category, "city": city_canonical})
     context.user_data["stage"] = UserFlow.showing_result.name
     context.user_data["taste"] = category
-    remember_context(
+    await remember_context(
         user_id,
         mode=context.user_data.get("mode"),
         category=category,
@@ -2279,7 +2527,7 @@ async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     explicit_category = get_selected_category(context)
     city = context.user_data.get("city") or state.get("city") or "Астана"
     context.user_data["city"] = city
-    remember_context(user_id, city=city)
+    await remember_context(user_id, city=city)
     city = ensure_user_state(user_id).get("city") or city
     context.user_data["city"] = city
     normalized_text = normalize(text)
@@ -2298,7 +2546,7 @@ async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if direct_category != taste:
             context.user_data["taste"] = direct_category
             taste = direct_category
-            remember_context(user_id, category=direct_category, last_action="category_shortcut")
+            await remember_context(user_id, category=direct_category, last_action="category_shortcut")
             await send_text_safely(
                 context,
                 chat_id,
@@ -2324,7 +2572,7 @@ async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
         taste = inferred
         context.user_data["taste"] = inferred
         set_selected_category(context, inferred)
-        remember_context(user_id, category=inferred, last_action="category_inferred")
+        await remember_context(user_id, category=inferred, last_action="category_inferred")
         await send_text_safely(
             context,
             chat_id,
@@ -2338,7 +2586,7 @@ async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return ASK_QUERY
         set_processing_random(user_id, True)
         context.user_data["stage"] = UserFlow.waiting_for_input.name
-        remember_context(user_id, mode=mode, category=taste, last_action="random")
+        await remember_context(user_id, mode=mode, category=taste, last_action="random")
         context.user_data.pop(SKIP_NEXT_MESSAGE, None)
         reaction = reaction_message(taste)
         await send_text_safely(context, chat_id, reaction, reply_markup=query_keyboard())
@@ -2355,136 +2603,131 @@ async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ASK_QUERY
 
     context.user_data["stage"] = UserFlow.waiting_for_input.name
-    remember_context(user_id, query=text.strip() or None, last_action="search")
+    await remember_context(user_id, query=text.strip() or None, last_action="search")
 
     terms = expand_terms(text)
     primary_norm = normalize(text)
     await send_thinking(context, chat_id)
 
-    with closing(get_conn()) as conn:
-        if mode == "recipe":
-            recipes = fetch_recipes(
-                conn,
-                terms,
+    if mode == "recipe":
+        recipes = await run_db(
+            fetch_recipes,
+            terms,
+            taste,
+            limit=3,
+            primary=primary_norm,
+            selected_category=explicit_category,
+        )
+        if not recipes and taste and taste != "random":
+            recipes = await run_db(
+                fetch_recipes,
+                [],
                 taste,
                 limit=3,
                 primary=primary_norm,
                 selected_category=explicit_category,
             )
-            if not recipes and taste and taste != "random":
-                recipes = fetch_recipes(
-                    conn,
-                    [],
-                    taste,
-                    limit=3,
-                    primary=primary_norm,
-                    selected_category=explicit_category,
-                )
-            if not recipes:
-                context.user_data["stage"] = UserFlow.showing_result.name
-                await handle_no_results(
-                    context,
-                    chat_id,
-                    user_id=user_id,
-                    mode="recipe",
-                    category=taste,
-                    query=text,
-                    city=city,
-                )
-                set_processing_category(user_id, False)
-                return ASK_QUERY
-
-            store_queue(
+        if not recipes:
+            context.user_data["stage"] = UserFlow.showing_result.name
+            await handle_no_results(
                 context,
-                "recipe",
-                recipes,
-                {"kind": "search", "terms": terms, "taste": taste, "primary": primary_norm},
-            )
-            last_recipe_id = get_last_suggestions(context).get("recipe")
-            first_recipe = None
-            for candidate in recipes:
-                first_recipe = candidate
-                if suggestion_id(candidate) != last_recipe_id:
-                    break
-            first_recipe = first_recipe or recipes[0]
-            category_for_msg = first_recipe.get("category") or taste or detect_category_from_text(
-                first_recipe.get("tags"), first_recipe.get("keywords")
-            )
-            context.user_data["taste"] = category_for_msg
-            remember_context(
-                user_id,
-                mode=mode,
-                category=category_for_msg,
-                last_choice=first_recipe.get("title"),
-                last_action="search_recipe",
+                chat_id,
+                user_id=user_id,
+                mode="recipe",
+                category=taste,
+                query=text,
+                city=city,
             )
-            context.user_data["stage"] = UserFlow.showing_result.name
-            await send_text_safely(context, chat_id, pick_bridge_phrase(), reply_markup=query_keyboard())
-            await cozy_delay()
-            await send_recipe_card(context, chat_id, first_recipe)
-        else:
-            city_value = canonicalize_city(city or "Алматы") or "Алматы"
+            set_processing_category(user_id, False)
+            return ASK_QUERY
+
+        store_queue(
+            context,
+            "recipe",
+            recipes,
+            {"kind": "search", "terms": terms, "taste": taste, "primary": primary_norm},
+        )
+        last_recipe_id = get_last_suggestions(context).get("recipe")
+        first_recipe = None
+        for candidate in recipes:
+            first_recipe = candidate
+            if suggestion_id(candidate) != last_recipe_id:
+                break
+        first_recipe = first_recipe or recipes[0]
+        category_for_msg = first_recipe.get("category") or taste or detect_category_from_text(
+            first_recipe.get("tags"), first_recipe.get("keywords")
+        )
+        context.user_data["taste"] = category_for_msg
+        await remember_context(
+            user_id,
+            mode=mode,
+            category=category_for_msg,
+            last_choice=first_recipe.get("title"),
+            last_action="search_recipe",
+        )
+        context.user_data["stage"] = UserFlow.showing_result.name
+        # Фраза-мостик идёт в подпись карточки: один запрос к API вместо сообщения, паузы и фото.
+        # Клавиатура query_keyboard уже показана — в ASK_QUERY без неё не попасть.
+        await send_recipe_card(context, chat_id, first_recipe, lead=pick_bridge_phrase())
+    else:
+        city_value = canonicalize_city(city or "Алматы") or "Алматы"
+        places = await fetch_restaurants(
+            city_value,
+            terms,
+            taste,
+            limit=3,
+            primary=primary_norm,
+            selected_category=explicit_category,
+        )
+        if not places and taste and taste != "random":
             places = await fetch_restaurants(
-                conn,
                 city_value,
-                terms,
+                [],
                 taste,
                 limit=3,
                 primary=primary_norm,
                 selected_category=explicit_category,
             )
-            if not places and taste and taste != "random":
-                places = await fetch_restaurants(
-                    conn,
-                    city_value,
-                    [],
-                    taste,
-                    limit=3,
-                    primary=primary_norm,
-                    selected_category=explicit_category,
-                )
-            if not places:
-                context.user_data["stage"] = UserFlow.showing_result.name
-                await handle_no_results(
-                    context,
-                    chat_id,
-                    user_id=user_id,
-                    mode="restaurant",
-                    category=taste,
-                    query=text,
-                    city=city_value,
-                )
-                set_processing_category(user_id, False)
-                return ASK_QUERY
-
-            store_queue(
+        if not places:
+            context.user_data["stage"] = UserFlow.showing_result.name
+            await handle_no_results(
                 context,
-                "place",
-                places,
-                {"kind": "search", "terms": terms, "taste": taste, "city": city_value, "primary": primary_norm},
-            )
-            last_place_id = get_last_suggestions(context).get("place")
-            first_place = None
-            for candidate in places:
-                first_place = candidate
-                if suggestion_id(candidate) != last_place_id:
-                    break
-            first_place = first_place or places[0]
-            category_for_msg = first_place.get("category") or taste or detect_category_from_text(
-                first_place.get("tags"), first_place.get("keywords")
-            )
-            context.user_data["taste"] = category_for_msg
-            remember_context(
-                user_id,
-                mode=mode,
-                category=category_for_msg,
-                last_choice=first_place.get("name"),
-                last_action="search_place",
+                chat_id,
+                user_id=user_id,
+                mode="restaurant",
+                category=taste,
+                query=text,
+                city=city_value,
             )
-            context.user_data["stage"] = UserFlow.showing_result.name
-            await send_text_safely(context, chat_id, pick_bridge_phrase(), reply_markup=query_keyboard())
-            await cozy_delay()
-            await send_place_card(context, chat_id, first_place)
+            set_processing_category(user_id, False)
+            return ASK_QUERY
+
+        store_queue(
+            context,
+            "place",
+            places,
+            {"kind": "search", "terms": terms, "taste": taste, "city": city_value, "primary": primary_norm},
+        )
+        last_place_id = get_last_suggestions(context).get("place")
+        first_place = None
+        for candidate in places:
+            first_place = candidate
+            if suggestion_id(candidate) != last_place_id:
+                break
+        first_place = first_place or places[0]
+        category_for_msg = first_place.get("category") or taste or detect_category_from_text(
+            first_place.get("tags"), first_place.get("keywords")
+        )
+        context.user_data["taste"] = category_for_msg
+        await remember_context(
+            user_id,
+            mode=mode,
+            category=category_for_msg,
+            last_choice=first_place.get("name"),
+            last_action="search_place",
+        )
+        context.user_data["stage"] = UserFlow.showing_result.name
+        await send_place_card(context, chat_id, first_place, lead=pick_bridge_phrase())
 
     set_processing_category(user_id, False)
     return ASK_QUERY
@@ -2521,50 +2764,47 @@ async def next_item(context: ContextTypes.DEFAULT_TYPE, chat_id: int, item_type:
     kind = meta.get("kind")
     explicit_category = get_selected_category(context)
     place_candidates: list[dict] = []
-    with closing(get_conn()) as conn:
-        if item_type == "recipe":
-            if kind == "random":
-                new_item = fetch_random_recipe(
-                    conn,
-                    chat_id,
-                    meta.get("taste"),
-                    selected_category=explicit_category,
-                )
-            else:
-                new_item = fetch_recipes(
-                    conn,
-                    meta.get("terms", []),
-                    meta.get("taste"),
-                    limit=1,
-                    primary=meta.get("primary"),
-                    selected_category=explicit_category,
-                )
-                new_item = new_item[0] if new_item else None
+    if item_type == "recipe":
+        if kind == "random":
+            new_item = await run_db(
+                fetch_random_recipe,
+                chat_id,
+                meta.get("taste"),
+                selected_category=explicit_category,
+            )
         else:
-            city = meta.get("city") or context.user_data.get("city", "Алматы")
-            if kind == "random":
-                new_items = await fetch_random_place(
-                    conn,
-                    chat_id,
-                    city,
-                    meta.get("taste"),
-                    selected_category=explicit_category,
-                    context=context,
-                )
-                place_candidates = new_items or []
-                new_item = place_candidates[0] if place_candidates else None
-            else:
-                new_items = await fetch_restaurants(
-                    conn,
-                    city,
-                    meta.get("terms", []),
-                    meta.get("taste"),
-                    limit=1,
-                    primary=meta.get("primary"),
-                    selected_category=explicit_category,
-                )
-                place_candidates = new_items or []
-                new_item = place_candidates[0] if place_candidates else None
+            new_item = await run_db(
+                fetch_recipes,
+                meta.get("terms", []),
+                meta.get("taste"),
+                limit=1,
+                primary=meta.get("primary"),
+                selected_category=explicit_category,
+            )
+            new_item = new_item[0] if new_item else None
+    else:
+        city = meta.get("city") or context.user_data.get("city", "Алматы")
+        if kind == "random":
+            new_items = await fetch_random_place(
+                chat_id,
+                city,
+                meta.get("taste"),
+                selected_category=explicit_category,
+                context=context,
+            )
+            place_candidates = new_items or []
+            new_item = place_candidates[0] if place_candidates else None
+        else:
+            new_items = await fetch_restaurants(
+                city,
+                meta.get("terms", []),
+                meta.get("taste"),
+                limit=1,
+                primary=meta.get("primary"),
+                selected_category=explicit_category,
+            )
+            place_candidates = new_items or []
+            new_item = place_candidates[0] if place_candidates else None
     if not new_item:
         label = taste_label(meta.get("taste"))
         await context.bot.send_message(
@@ -2580,26 +2820,24 @@ async def next_item(context: ContextTypes.DEFAULT_TYPE, chat_id: int, item_type:
                 new_item = candidate
                 break
     if suggestion_id(new_item) == last_id:
-        with closing(get_conn()) as conn:
-            if item_type == "recipe":
-                alt = fetch_random_recipe(
-                    conn,
-                    chat_id,
-                    meta.get("taste"),
-                    selected_category=explicit_category,
-                )
-            else:
-                alt_items = await fetch_random_place(
-                    conn,
-                    chat_id,
-                    meta.get("city") or context.user_data.get("city", "Алматы"),
-                    meta.get("taste"),
-                    selected_category=explicit_category,
-                    context=context,
-                )
-                alt = alt_items[0] if alt_items else None
-                if alt_items:
-                    place_candidates = alt_items
+        if item_type == "recipe":
+            alt = await run_db(
+                fetch_random_recipe,
+                chat_id,
+                meta.get("taste"),
+                selected_category=explicit_category,
+            )
+        else:
+            alt_items = await fetch_random_place(
+                chat_id,
+                meta.get("city") or context.user_data.get("city", "Алматы"),
+                meta.get("taste"),
+                selected_category=explicit_category,
+                context=context,
+            )
+            alt = alt_items[0] if alt_items else None
+            if alt_items:
+                place_candidates = alt_items
         if alt and suggestion_id(alt) != last_id:
             new_item = alt
     if item_type == "place" and place_candidates:
@@ -2629,59 +2867,57 @@ async def feedback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
     answered = False
 
-    with closing(get_conn()) as conn, conn:
-        if item_type == "recipe":
-            item = fetch_recipe_by_id(conn, item_id) if isinstance(item_id, int) else current_item(context, "recipe")
-        else:
-            item = fetch_restaurant_by_id(conn, item_id) if isinstance(item_id, int) else None
-            if not item:
-                item = current_item(context, "place")
-        current_item_id = suggestion_id(item)
-
+    if item_type == "recipe":
+        item = await run_db(fetch_recipe_by_id, item_id) if isinstance(item_id, int) else current_item(context, "recipe")
+    else:
+        item = await run_db(fetch_restaurant_by_id, item_id) if isinstance(item_id, int) else None
         if not item:
-            await query.answer("Нет данных, ищу другой вариант", show_alert=False)
-            answered = True
-            await query.edit_message_reply_markup(None)
-            await context.bot.send_message(chat_id=chat_id, text="Не удалось найти этот вариант, попробуем другой 👇")
-            await next_item(context, chat_id, item_type)
-            return
+            item = current_item(context, "place")
 
-        if action == "like":
-            await query.answer("Сохранил 👍", show_alert=False)
-            answered = True
-            apply_feedback(conn, chat_id, item, item_type, True)
-            log_item_feedback(user_id, current_item_id, item_type, "like", conn=conn)
-            print(f"Feedback: {user_id} -> like")
-            remember_context(user_id, last_action="feedback")
-            await query.edit_message_reply_markup(None)
-            await context.bot.send_message(chat_id=chat_id, text=random.choice(LIKE_REPLIES))
-            await maybe_send_hint(context, chat_id)
-            await next_item(context, chat_id, item_type)
-            return
-        if action == "dislike":
-            await query.answer("Запомнил 👎", show_alert=False)
-            answered = True
-            apply_feedback(conn, chat_id, item, item_type, False)
-            log_item_feedback(user_id, current_item_id, item_type, "dislike", conn=conn)
-            print(f"Feedback: {user_id} -> dislike")
-            remember_context(user_id, last_action="feedback")
-            await query.edit_message_reply_markup(None)
-            await context.bot.send_message(chat_id=chat_id, text="Окей, запомнил что не зашло 👎")
-            await cozy_delay()
-            await send_text_safely(context, chat_id, "Сейчас покажу другой вариант 👇", reply_markup=query_keyboard())
-            await cozy_delay()
-            context.user_data[SKIP_NEXT_MESSAGE] = True
-            await next_item(context, chat_id, item_type)
-            return
-        if action == "next":
-            await query.answer("Ищу дальше 🔁", show_alert=False)
-            answered = True
-            await query.edit_message_reply_markup(None)
-            log_item_feedback(user_id, current_item_id, item_type, "next", conn=conn)
-            print(f"Feedback: {user_id} -> next")
-            remember_context(user_id, last_action="feedback")
-            await next_item(context, chat_id, item_type)
-            return
+    if not item:
+        await query.answer("Нет данных, ищу другой вариант", show_alert=False)
+        answered = True
+        await query.edit_message_reply_markup(None)
+        await context.bot.send_message(chat_id=chat_id, text="Не удалось найти этот вариант, попробуем другой 👇")
+        await next_item(context, chat_id, item_type)
+        return
+
+    if action == "like":
+        await query.answer("Сохранил 👍", show_alert=False)
+        answered = True
+        await run_db_write(record_item_feedback, chat_id, user_id, item, item_type, "like")
+        queue_preference_feedback(chat_id, True)
+        print(f"Feedback: {user_id} -> like")
+        await remember_context(user_id, last_action="feedback")
+        await query.edit_message_reply_markup(None)
+        await context.bot.send_message(chat_id=chat_id, text=random.choice(LIKE_REPLIES))
+        await maybe_send_hint(context, chat_id)
+        await next_item(context, chat_id, item_type)
+        return
+    if action == "dislike":
+        await query.answer("Запомнил 👎", show_alert=False)
+        answered = True
+        await run_db_write(record_item_feedback, chat_id, user_id, item, item_type, "dislike")
+        queue_preference_feedback(chat_id, False)
+        print(f"Feedback: {user_id} -> dislike")
+        await remember_context(user_id, last_action="feedback")
+        await query.edit_message_reply_markup(None)
+        await context.bot.send_message(chat_id=chat_id, text="Окей, запомнил что не зашло 👎")
+        await cozy_delay()
+        await send_text_safely(context, chat_id, "Сейчас покажу другой вариант 👇", reply_markup=query_keyboard())
+        await cozy_delay()
+        context.user_data[SKIP_NEXT_MESSAGE] = True
+        await next_item(context, chat_id, item_type)
+        return
+    if action == "next":
+        await query.answer("Ищу дальше 🔁", show_alert=False)
+        answered = True
+        await query.edit_message_reply_markup(None)
+        await run_db_write(record_item_feedback, chat_id, user_id, item, item_type, "next")
+        print(f"Feedback: {user_id} -> next")
+        await remember_context(user_id, last_action="feedback")
+        await next_item(context, chat_id, item_type)
+        return
 
     if not answered:
         await query.answer()
@@ -2701,13 +2937,12 @@ async def add_place_favorite(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     place = current_item(context, "place")
     if not place or (place_id and str(suggestion_id(place))) != place_id:
-        with closing(get_conn()) as conn:
-            try:
-                numeric_id = int(place_id) if place_id is not None else None
-            except ValueError:
-                numeric_id = None
-            if numeric_id is not None:
-                place = fetch_restaurant_by_id(conn, numeric_id)
+        try:
+            numeric_id = int(place_id) if place_id is not None else None
+        except ValueError:
+            numeric_id = None
+        if numeric_id is not None:
+            place = await run_db(fetch_restaurant_by_id, numeric_id)
     if not place:
         await query.message.reply_text("Не удалось добавить в избранное 😔")
         return
@@ -2717,47 +2952,48 @@ async def add_place_favorite(update: Update, context: ContextTypes.DEFAULT_TYPE)
     address = place.get("address") or ""
     photo_url = place.get("photo_url") or place.get("image")
 
-    with closing(get_conn()) as conn, conn:
-        conn.execute(
-            """
-            INSERT OR IGNORE INTO favorite_places(chat_id, place_id, name, address, photo_url)
-            VALUES(?,?,?,?,?)
-            """,
-            (chat_id, place_id, name, address, photo_url),
-        )
+    await run_db_write(save_place_favorite, chat_id, place_id, name, address, photo_url)
     await query.message.reply_text("❤️ Добавил в избранное!")
 
 
+# Оба списка «Избранного» одним запросом: каждая ветка со своим порядком и лимитом, строки помечены kind.
+_FAVORITES_SQL = """
+SELECT 'recipe' AS kind, title AS name, NULL AS address FROM (
+    SELECT r.title
+    FROM user_history h
+    JOIN recipes r ON r.id = h.item_id
+    WHERE h.chat_id=? AND h.item_type='recipe' AND h.liked=1
+    ORDER BY h.created_at DESC
+    LIMIT 15
+)
+UNION ALL
+SELECT 'place' AS kind, name, address FROM (
+    SELECT name, address
+    FROM favorite_places
+    WHERE chat_id=?
+    ORDER BY name
+    LIMIT 15
+)
+"""
+
+
+def fetch_favorites(conn, chat_id: int):
+    recipe_rows = []
+    place_rows = []
+    for row in conn.execute(_FAVORITES_SQL, (chat_id, chat_id)):
+        (recipe_rows if row["kind"] == "recipe" else place_rows).append(row)
+    return recipe_rows, place_rows
+
+
 async def favorites(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    with closing(get_conn()) as conn:
-        recipe_rows = conn.execute(
-            """
-            SELECT r.title
-            FROM user_history h
-            JOIN recipes r ON r.id = h.item_id
-            WHERE h.chat_id=? AND h.item_type='recipe' AND h.liked=1
-            ORDER BY h.created_at DESC
-            LIMIT 15
-            """,
-            (chat_id,),
-        ).fetchall()
-        place_rows = conn.execute(
-            """
-            SELECT name, address
-            FROM favorite_places
-            WHERE chat_id=?
-            ORDER BY name
-            LIMIT 15
-            """,
-            (chat_id,),
-        ).fetchall()
+    recipe_rows, place_rows = await run_db(fetch_favorites, chat_id)
     if not recipe_rows and not place_rows:
         await update.message.reply_text("Пока ничего нет. ❤️ Добавляй понравившиеся блюда и места!")
         return
     parts = []
     if recipe_rows:
-        titles = "\n".join(f"• {row['title']}" for row in recipe_rows)
+        titles = "\n".join(f"• {row['name']}" for row in recipe_rows)
         parts.append(f"Блюда 🍽:\n{titles}")
     if place_rows:
         places_text = "\n".join(f"• {row['name']} ({row['address']})" for row in place_rows)
@@ -2793,11 +3029,15 @@ async def configure_commands(app: Application):
         )
     except TelegramError as exc:
         log.warning("Не удалось обновить команды бота: %s", exc)
+    # Прогрев Gemini — фоновой задачей на loop бота, чтобы не задерживать старт polling.
+    app.create_task(ai_service.warmup_ai())
 
 
 def main():
     init_db()
     ensure_synonyms()
+    # Синонимы нужны с первого же запроса — читаем их до старта, а не в event loop.
+    load_synonym_rows()
     request = HTTPXRequest(connect_timeout=25, read_timeout=60, write_timeout=60, pool_timeout=20)
     app = ApplicationBuilder().token(BOT_TOKEN).request(request).build()
     app.post_init = configure_commands
@@ -2822,6 +3062,7 @@ def main():
         allow_reentry=True,
     )
 
+    app.add_handler(TypeHandler(Update, preload_user_context), group=-1)
     app.add_handler(CommandHandler("ask", ask_ai))
     app.add_handler(CommandHandler("recipe", recipe_cmd))
     app.add_handler(CommandHandler("place", place_cmd))
@@ -1,6 +1,5 @@
 # seed_db.py — база данных для FindFood 4.0
-from contextlib import closing
-from db import get_conn, init_db
+from db import init_db, shared_conn
 import random
 from typing import Optional
 
@@ -954,8 +953,8 @@ def seed_questions(conn):
 
 if __name__ == "__main__":
     init_db()
-    with closing(get_conn()) as conn:
-        seed_recipes(conn)
-        seed_restaurants(conn)
-        seed_questions(conn)
+    conn = shared_conn()
+    seed_recipes(conn)
+    seed_restaurants(conn)
+    seed_questions(conn)
     print("✅ Seeded recipes, restaurants и questions for FindFood 5.3")